@@ -5,6 +5,7 @@ import awkward as ak
 import numpy as np
 import ROOT
 from array import array
+from trigMatch import matchLeptons
 
 # Sets batch mode so no popup window                                                                                                                                                                       
 ROOT.gROOT.SetBatch(True)
@@ -142,45 +143,23 @@ cutElectrons = (
 
 goodElectrons = electrons[cutElectrons]
 
-# Computes deltaR2                                                                                                                                                                                         
+# Gets matched online/offline electrons from file
 
-def deltaR2(eta1, phi1, eta2, phi2):
-    deta = eta1 - eta2
-    dphi = phi1 - phi2
-    dphi = np.mod(dphi + np.pi, 2*np.pi) - np.pi
+def isHLTMatched(events, goodElectrons):
 
-    return deta**2 + dphi**2
+    # Trigger objects must also pass the offline electron acceptance; the id and
+    # filter bit requirements are in trigMatch.FILTER_BITS
 
-# Gets matched online/offline electrons from file                                                                                                                                                          
+    trigMask = ((events["TrigObj_pt"] >= 35)
+                & ((abs(events["TrigObj_eta"]) < 1.444) | (abs(events["TrigObj_eta"]) > 1.566))
+                & (abs(events["TrigObj_eta"]) < 2.5))
+
+    matched, minDR, index = matchLeptons(goodElectrons.eta, goodElectrons.phi,
+                                         events["TrigObj_eta"], events["TrigObj_phi"],
+                                         events["TrigObj_id"], events["TrigObj_filterBits"],
+                                         "Electron", maxDR=np.sqrt(0.1), trigMask=trigMask)
+    match1El = ak.any(matched, axis=1)
 
-def isHLTMatched(events, goodElectrons):
-    trigObj = ak.zip({
-            "pt": events["TrigObj_pt"],
-            "eta": events["TrigObj_eta"],
-            "phi": events['TrigObj_phi'],
-            "mass": 0.,
-            "id": events['TrigObj_id'],
-            "filterBits": events['TrigObj_filterBits']
-            }, with_name = "Momentum4D")
-    
-    # Defining the conditions for filtering each trigger
-    
-    filterbits1 = ((events['TrigObj_filterBits'] & 2) == 2)
-    filterbits2 = ((events['TrigObj_filterBits'] & 2048) == 2048)
-    filterbits3 = ((events['TrigObj_filterBits'] & 8192) == 8192)
-    
-    trigObjSingleEl = trigObj[((abs(trigObj.id) == 11)
-                               & (trigObj.pt >= 35)
-                               & ((abs(trigObj.eta) < 1.444) | (abs(trigObj.eta) > 1.566))
-                               & (abs(trigObj.eta) < 2.5)
-                               & (filterbits1 |
-                                filterbits2 |
-                                filterbits3))]
-
-    toMatch1El, trigObjSingleEl = ak.unzip(ak.cartesian([goodElectrons, trigObjSingleEl], axis=1, nested = True))
-    alldr2 = deltaR2(toMatch1El.eta, toMatch1El.phi, trigObjSingleEl.eta, trigObjSingleEl.phi)
-    match1El                    = (ak.sum(ak.where(ak.min(alldr2, axis=2) < 0.1, True, False), axis = 1) >= 1)
-    
     return match1El
     
 # Defines binning and histograms                                                                                                                                                                           
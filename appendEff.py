@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+from mergeOutputs import readHistos, addHistos, writeHistos
+from provenance import fileStamp
+from trigEffUtils import popOption
+
+# Incremental append mode of the efficiency scripts.
+# Usage: python3 appendEff.py script.py <script arguments> output.root inputs... [script options] [--state path]
+#   e.g. python3 appendEff.py for_data.py Muon data Eta 2018 muon_2018.root /eos/.../Muon2018/ --engine columnar
+# Inputs are files, entry ranges or folders (every *.root file in them). A
+# state file (default output.root.state.json) records the inputs already
+# folded into the output; only the other inputs are processed, by running the
+# script on them into a temporary file, and their counts are added into the
+# _num/_den histograms of the output. The summed output is written next to it
+# and renamed over it, so it is never left half-written. The state records a
+# hash of the output it describes and of the one before, so an append
+# interrupted between writing the state and renaming the output is detected
+# and rolled back on the next run. An input changed after being folded can't
+# be subtracted again: the output then has to be rebuilt from scratch.
+
+# Index of the output file among the arguments of each script
+OUTPUT_ARGUMENT = {"for_data.py": 4, "quickerFor_data.py": 4, "dataDoTriggerEff.py": 4, "doTriggerEff.py": 3}
+
+
+def fileHash(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def splitArguments(arguments):
+    """(inputs, script options) of the arguments after the output file; every option takes a value."""
+    inputs, options = [], []
+    i = 0
+    while i < len(arguments):
+        if arguments[i].startswith("--"):
+            options += arguments[i:i + 2]
+            i += 2
+        else:
+            inputs.append(arguments[i])
+            i += 1
+    return inputs, options
+
+
+def expandInputs(inputs):
+    """Input specs with every folder replaced by its *.root files."""
+    specs = []
+    for spec in inputs:
+        if os.path.isdir(spec):
+            specs += sorted(glob.glob(os.path.join(spec, "*.root")))
+        else:
+            specs.append(spec)
+    return specs
+
+
+def writeJson(path, record):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(record, f, indent=1)
+    os.replace(tmp, path)
+
+
+def readState(statePath, outputPath, script, selectionArguments):
+    """The folded [spec, stamp] pairs, after checking the state against the output; raises ValueError when they disagree."""
+    outputHash = fileHash(outputPath)
+    if not os.path.exists(statePath):
+        if outputHash is not None:
+            raise ValueError(f"{outputPath} exists without the state file {statePath}, rebuild it in append mode")
+        return []
+    with open(statePath) as f:
+        state = json.load(f)
+    if [state["script"], state["arguments"]] != [script, selectionArguments]:
+        raise ValueError(f"{outputPath} was made by {state['script']} {' '.join(state['arguments'])}")
+    if outputHash == state["output"]:
+        return state["inputs"]
+    if outputHash == state["previous"]["output"]:
+        # Interrupted after the state was written, before the output was renamed
+        print(f"Rolling back the unfinished append to {outputPath}")
+        writeJson(statePath, {**state, "inputs": state["previous"]["inputs"], "output": outputHash})
+        return state["previous"]["inputs"]
+    raise ValueError(f"{outputPath} doesn't match its state file {statePath}, rebuild it in append mode")
+
+
+def newInputs(folded, inputs):
+    """Inputs not folded yet; raises ValueError for a folded input changed since."""
+    stamps = dict((spec, stamp) for spec, stamp in folded)
+    changed = [spec for spec in inputs if spec in stamps and stamps[spec] != fileStamp(spec)]
+    if changed:
+        raise ValueError(f"{changed} changed after being folded into the output, rebuild it from scratch")
+    return [spec for spec in inputs if spec not in stamps]
+
+
+if __name__ == "__main__":
+    statePath = popOption(sys.argv, "--state")
+    scriptPath = sys.argv[1]
+    script = os.path.basename(scriptPath)
+    if script not in OUTPUT_ARGUMENT:
+        raise ValueError(f"Unknown script {script}, use one of {list(OUTPUT_ARGUMENT)}")
+    arguments = sys.argv[2:]
+    selectionArguments = arguments[:OUTPUT_ARGUMENT[script]]
+    outputPath = arguments[OUTPUT_ARGUMENT[script]]
+    inputs, options = splitArguments(arguments[OUTPUT_ARGUMENT[script] + 1:])
+    inputs = expandInputs(inputs)
+    if statePath is None:
+        statePath = outputPath + ".state.json"
+
+    folded = readState(statePath, outputPath, script, selectionArguments)
+    delta = newInputs(folded, inputs)
+    if not delta:
+        print(f"All {len(inputs)} inputs are already in {outputPath}")
+        sys.exit(0)
+    print(f"Appending {len(delta)} new inputs to the {len(folded)} of {outputPath}")
+
+    deltaPath = f"{outputPath}.delta.{os.getpid()}.root"
+    summedPath = f"{outputPath}.sum.{os.getpid()}.root"
+    try:
+        stamps = [[spec, fileStamp(spec)] for spec in delta]
+        subprocess.run([sys.executable, scriptPath] + selectionArguments + [deltaPath] + delta + options, check=True)
+        histos = readHistos(deltaPath)
+        if os.path.exists(outputPath):
+            histos = addHistos(readHistos(outputPath), histos, deltaPath)
+        writeHistos(summedPath, histos)
+        # The state goes first: until the rename it still knows the current output as "previous"
+        writeJson(statePath, {
+            "script": script, "arguments": selectionArguments,
+            "inputs": folded + stamps, "output": fileHash(summedPath),
+            "previous": {"inputs": folded, "output": fileHash(outputPath)},
+        })
+        os.replace(summedPath, outputPath)
+    finally:
+        for path in [deltaPath, summedPath]:
+            if os.path.exists(path):
+                os.remove(path)
+    print(f"{outputPath} now holds {len(folded) + len(delta)} inputs")
@@ -0,0 +1,299 @@
+import numpy as np
+import awkward as ak
+import uproot
+
+from trigEffUtils import LEPTON_BRANCHES, JET_BRANCHES, TRIGOBJ_BRANCHES, fillCounts, entryRange
+from refCuts import refBranches, refCutMask
+from trigMatch import deltaR, matchLeadingLepton
+
+# Columnar (uproot/awkward) version of the for_data.py event loop.
+# Events are read in chunks and every cut is an array operation; the results
+# are accumulated into count arrays laid out like the ROOT histograms.
+#
+# Files are read in two phases: the cheap scalar branches (reference cuts,
+# MET, HLT bits) first, for the whole file, and the jagged lepton/jet/trigger
+# object branches afterwards only for the clusters that still hold events
+# passing the cheap cuts. Most data events fail the reference cuts, so most
+# of the jagged baskets are never decompressed.
+#
+# Besides the for_data.py selection, cfg flags select the variants of the
+# other scripts (see fastLoop.py for dRVeto, metJetVetoAlways, refInNum and
+# refInDen):
+#   hltRequired      drop events failing the HLT OR up front (quickerFor_data.py)
+#   metRequired      drop events below the offline MET cut up front (quickerFor_data.py)
+#   mtRequired       drop events outside the offline mT window (quickerFor_data.py)
+
+STEP_SIZE = 200000
+# Per-event column filled into each histogram variable
+FILL_COLUMNS = {"lep1pt": "lep1pt", "MET": "MET", "mT": "mT", "lep1phi": "lep1phi", "MET phi": "MET_phi"}
+
+
+def cheapBranches(cfg, available):
+    """Scalar branches of the first phase; HLT paths missing from the file count as False."""
+    branches = ["MET_pt", "MET_phi"]
+    if cfg["data"] == "data":
+        branches += [b for b in refBranches(cfg["era"], cfg["refMetCut"]) if b not in branches]
+    for hltpath in list(cfg["hlt"]) + [cfg["refhlt"]]:
+        if hltpath in available and hltpath not in branches:
+            branches.append(hltpath)
+    return branches
+
+
+def jaggedBranches(cfg):
+    return LEPTON_BRANCHES[cfg["lepton"]] + JET_BRANCHES + TRIGOBJ_BRANCHES
+
+
+def neededBranches(cfg, available):
+    """All branches read from Events."""
+    return jaggedBranches(cfg) + cheapBranches(cfg, available)
+
+
+def triggerBit(arrays, hltpath):
+    if hltpath in arrays.fields:
+        return ak.to_numpy(arrays[hltpath]).astype(bool)
+    return np.zeros(len(arrays), dtype=bool)
+
+
+def leptonCuts(arrays, lepton):
+    """Per-lepton version of passes_lepton_cuts."""
+    if lepton == "Muon":
+        return (
+            arrays["Muon_tightId"]
+            & (abs(arrays["Muon_eta"]) < 2.4)
+            & (abs(arrays["Muon_dz"]) <= 0.05)
+            & (abs(arrays["Muon_dxy"]) <= 0.02)
+            & (arrays["Muon_pfIsoId"] >= 5))
+    else:
+        absEta = abs(arrays["Electron_eta"])
+        return (
+            (arrays["Electron_cutBased"] >= 2)
+            & arrays["Electron_mvaFall17V2Iso_WP80"]
+            & (abs(arrays["Electron_dxy"]) < 0.05 + 0.05 * (absEta > 1.479))
+            & (abs(arrays["Electron_dz"]) < 0.10 + 0.10 * (absEta > 1.479))
+            & ((absEta < 1.444) | (absEta > 1.566))
+            & (absEta < 2.5))
+
+
+def leading(pt, *others):
+    """Leading entry of each jagged collection as float64 arrays, plus a has-entry mask."""
+    idx = ak.argmax(pt, axis=1, keepdims=True)
+    found = ak.to_numpy(ak.num(pt) > 0)
+    values = [np.asarray(ak.fill_none(ak.firsts(col[idx]), np.nan), dtype=np.float64) for col in (pt,) + others]
+    return found, values
+
+
+def dPhi(obj_phi, jet_phi):
+    return np.arccos(np.cos(obj_phi - jet_phi))
+
+
+def etaBinIndex(lepton_eta, eta_ranges):
+    """Index into eta_ranges for each event (-1 when outside every range), like get_eta_bin."""
+    absEta = np.abs(lepton_eta)
+    idx = np.full(len(absEta), -1)
+    for i, (low, high) in reversed(list(enumerate(eta_ranges))):
+        idx[(low <= absEta) & (absEta < high)] = i
+    return idx
+
+
+def passHLTMask(arrays, cfg):
+    passHLT = np.zeros(len(arrays), dtype=bool)
+    for hltpath in cfg["hlt"]:
+        passHLT |= triggerBit(arrays, hltpath)
+    return passHLT
+
+
+def cheapMask(arrays, cfg, lumi_mask, stats):
+    """Events passing the cuts that only need the cheap branches."""
+    if cfg["data"] == "data":
+        mask = refCutMask(arrays, cfg["era"], lumi_mask, cfg["refMetCut"])
+    else:
+        mask = np.ones(len(arrays), dtype=bool)
+    stats["ref"] += int(mask.sum())
+    if cfg.get("hltRequired", False):
+        mask &= passHLTMask(arrays, cfg)
+    if cfg.get("metRequired", False):
+        mask &= ak.to_numpy(arrays["MET_pt"]) >= cfg["offlineCuts"]["MET"]
+    return mask
+
+
+def survivorRanges(mask, boundaries, stepSize):
+    """Entry ranges made of whole clusters holding at least one survivor.
+
+    Adjacent clusters are merged while the range stays within stepSize entries.
+    """
+    ranges = []
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        if not mask[start:stop].any():
+            continue
+        if ranges and ranges[-1][1] == start and stop - ranges[-1][0] <= stepSize:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def processChunk(arrays, cfg, lumi_mask, counts, stats):
+    """Selection on a chunk holding every branch of neededBranches."""
+    processSelected(arrays[cheapMask(arrays, cfg, lumi_mask, stats)], cfg, counts, stats)
+
+
+def processSelected(arrays, cfg, counts, stats, summary=None):
+    """Selection on events that already passed cheapMask.
+
+    The per-event columns of the selected events are appended to summary when
+    it is a list (see eventSummary.py).
+    """
+    lepton = cfg["lepton"]
+    offlineCuts = cfg["offlineCuts"]
+
+    # Leading lepton passing the lepton cuts
+    passing = leptonCuts(arrays, lepton)
+    hasLep, (lepPt, lepEta, lepPhi) = leading(arrays[lepton + "_pt"][passing],
+                                              arrays[lepton + "_eta"][passing],
+                                              arrays[lepton + "_phi"][passing])
+    stats["lepton"] += int(hasLep.sum())
+
+    # Leading jet above 60 GeV
+    jets = arrays["Jet_pt"] > 60
+    hasJet, (jetPt, jetEta, jetPhi) = leading(arrays["Jet_pt"][jets], arrays["Jet_eta"][jets], arrays["Jet_phi"][jets])
+    sel = hasLep & hasJet
+    stats["jet"] += int(sel.sum())
+
+    metPt = ak.to_numpy(arrays["MET_pt"]).astype(np.float64)
+    metPhi = ak.to_numpy(arrays["MET_phi"]).astype(np.float64)
+
+    # deltaR and dPhi vetoes between the lepton, the leading jet and MET
+    passmetCut = metPt >= offlineCuts["MET"]
+    with np.errstate(invalid="ignore"):
+        if cfg["dRVeto"]:
+            sel &= ~(deltaR(lepEta, lepPhi, jetEta, jetPhi) < 0.5)
+        sel &= ~(dPhi(lepPhi, jetPhi) < 1.5)
+        metJetVeto = dPhi(metPhi, jetPhi) < 1.5
+        if not cfg["metJetVetoAlways"]:
+            metJetVeto &= passmetCut
+        sel &= ~metJetVeto
+        mT = np.sqrt(2 * lepPt * metPt * (1 - np.cos(dPhi(lepPhi, metPhi))))
+        passmtCut = (offlineCuts["mT"][0] < mT) & (mT < offlineCuts["mT"][1])
+    if cfg.get("mtRequired", False):
+        sel &= passmtCut
+
+    arrays = arrays[sel]
+    lepPt, lepEta, lepPhi = lepPt[sel], lepEta[sel], lepPhi[sel]
+    metPt, metPhi = metPt[sel], metPhi[sel]
+    mT = mT[sel]
+    stats["below"] += int((lepPt < (27 if lepton == "Muon" else 32)).sum())
+
+    lepton_matched, _, _ = matchLeadingLepton(lepEta, lepPhi, arrays, lepton)
+
+    columns = {"lep1pt": lepPt, "lep1eta": lepEta, "lep1phi": lepPhi, "MET": metPt, "MET_phi": metPhi, "mT": mT,
+               "matched": lepton_matched, "passRef": triggerBit(arrays, cfg["refhlt"])}
+    for hltpath in cfg["hlt"]:
+        columns[hltpath] = triggerBit(arrays, hltpath)
+    fillSelected(columns, cfg, counts)
+    if summary is not None:
+        summary.append(columns)
+
+
+def offlineCutFlags(columns, offlineCuts):
+    """(lepton pT, MET, mT) offline cut decisions of the selected events."""
+    with np.errstate(invalid="ignore"):
+        return (columns["lep1pt"] >= offlineCuts["lep1pt"],
+                columns["MET"] >= offlineCuts["MET"],
+                (offlineCuts["mT"][0] < columns["mT"]) & (columns["mT"] < offlineCuts["mT"][1]))
+
+
+def fillSelected(columns, cfg, counts):
+    """Fill the num/den counts from the per-event columns of processSelected (or of a summary, see eventSummary.py)."""
+    passlepCut, passmetCut, passmtCut = offlineCutFlags(columns, cfg["offlineCuts"])
+    passHLT = np.zeros(len(columns["lep1pt"]), dtype=bool)
+    for hltpath in cfg["hlt"]:
+        passHLT |= columns[hltpath]
+    passRef = columns["passRef"]
+
+    denCuts = {
+        "lep1pt": passmetCut & passmtCut,
+        "MET": passlepCut & passmtCut,
+        "mT": passlepCut & passmetCut,
+        "lep1phi": passmetCut & passmtCut & passlepCut,
+        "MET phi": passmetCut & passmtCut & passlepCut,
+    }
+    passNum = passHLT & columns["matched"]
+    if cfg["refInNum"]:
+        passNum &= passRef
+
+    if cfg["etaOption"] == "Eta":
+        etaIdx = etaBinIndex(columns["lep1eta"], cfg["eta_ranges"])
+        prefixes = [(eta_bin + "_", etaIdx == i) for i, eta_bin in enumerate(cfg["eta_bins"])]
+    else:
+        prefixes = [("", np.ones(len(passHLT), dtype=bool))]
+
+    for prefix, inBin in prefixes:
+        for var, binning in cfg["histBins"].items():
+            passDen = inBin & denCuts[var]
+            if cfg["refInDen"]:
+                passDen = passDen & passRef
+            values = columns[FILL_COLUMNS[var]]
+            fillCounts(counts, f"{prefix}{var}_den", var, binning, values[passDen])
+            fillCounts(counts, f"{prefix}{var}_num", var, binning, values[passDen & passNum])
+
+
+def clusterBoundaries(tree, branches, entryStart, entryStop):
+    """Cluster boundaries of the branches within entryStart to entryStop, counted from entryStart."""
+    return ([0] + [b - entryStart for b in tree.common_entry_offsets(filter_name=branches)
+                   if entryStart < b < entryStop] + [entryStop - entryStart])
+
+
+def processFile(path, cfg, lumi_mask, counts, stepSize=STEP_SIZE, entryStart=0, entryStop=None, refEntries=None,
+                summary=None):
+    """Run the selection over entries entryStart to entryStop of one file, adding into counts.
+
+    refEntries, the sorted entry numbers passing the reference cuts (see
+    entryLists.py), restricts the reading to the clusters holding them.
+    summary, when a list, collects the per-event columns of the selected events.
+    Returns the cutflow numbers.
+    """
+    stats = {"nEv": 0, "ref": 0, "lepton": 0, "jet": 0, "below": 0}
+    with uproot.open(path) as f:
+        tree = f["Events"]
+        entryStart, entryStop = entryRange(tree.num_entries, entryStart, entryStop)
+        stats["nEv"] = entryStop - entryStart
+        if stats["nEv"] == 0:
+            return stats
+
+        # Phase 1: cheap scalar branches, keeping only the survivors
+        cheapNames = cheapBranches(cfg, set(tree.keys()))
+        if refEntries is None:
+            ranges = [(0, stats["nEv"])]
+        else:
+            refMask = np.zeros(stats["nEv"], dtype=bool)
+            refMask[np.asarray(refEntries, dtype=np.int64) - entryStart] = True
+            ranges = survivorRanges(refMask, clusterBoundaries(tree, cheapNames, entryStart, entryStop), stepSize)
+        masks, survivors = [], []
+        position = 0
+        for start, stop in ranges:
+            # Entries between the ranges have no reference-passing event
+            masks.append(np.zeros(start - position, dtype=bool))
+            for cheap in tree.iterate(cheapNames, step_size=stepSize,
+                                      entry_start=entryStart + start, entry_stop=entryStart + stop, library="ak"):
+                mask = cheapMask(cheap, cfg, lumi_mask, stats)
+                masks.append(mask)
+                survivors.append(cheap[mask])
+            position = stop
+        masks.append(np.zeros(stats["nEv"] - position, dtype=bool))
+        mask = np.concatenate(masks)
+        if not survivors:
+            return stats
+        cheap = ak.concatenate(survivors)
+        # Position in cheap of the first survivor at or after each entry (counted from entryStart)
+        cheapIndex = np.concatenate([[0], np.cumsum(mask)])
+
+        # Phase 2: jagged branches only for the clusters with survivors
+        jagged = jaggedBranches(cfg)
+        boundaries = clusterBoundaries(tree, jagged, entryStart, entryStop)
+        for start, stop in survivorRanges(mask, boundaries, stepSize):
+            arrays = tree.arrays(jagged, entry_start=entryStart + start, entry_stop=entryStart + stop,
+                                 library="ak")[mask[start:stop]]
+            for name in cheap.fields:
+                arrays[name] = cheap[name][cheapIndex[start]:cheapIndex[stop]]
+            processSelected(arrays, cfg, counts, stats, summary)
+    return stats
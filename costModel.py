@@ -0,0 +1,114 @@
+import glob
+import json
+import os
+import re
+import numpy as np
+
+from trigEffUtils import popOption
+
+# Per-job cost model of p3submitJobs.py, fitted on the telemetry of past jobs.
+# doTriggerEff.py ends by printing one TELEMETRY line (entries processed, wall
+# seconds, peak memory, engine, era, lepton) into its batch log. Before the
+# submitter clears batchlogs{tag} it appends those lines to a history file,
+# and the model predicts events per second and memory per (engine, era, lepton)
+# from the median rate and the peak memory of the matching past jobs, falling
+# back to (engine, lepton) and engine alone when a combination has no history.
+# Condor jobs are submitted with -spool, so their logs only reach batchlogs{tag}
+# once fetched with condor_transfer_data: the submitter does that for the
+# previous clusters (jobCheck.fetchSpooledLogs) before harvesting them.
+
+TELEMETRY_PREFIX = "TELEMETRY "
+
+
+def engineKey(engine, loop):
+    return engine if engine == "rdf" else f"{engine}-{loop}"
+
+
+def optionsEngineKey(options):
+    """engineKey of a doTriggerEff.py run with the given command-line options."""
+    argv = list(options)
+    return engineKey(popOption(argv, "--engine", "pyroot"), popOption(argv, "--loop", "standard"))
+
+
+def eraOf(path):
+    """Data-taking era guessed from a NanoAOD path (UL16APV, Run2018A, ...), "unknown" if none matches."""
+    match = re.search(r"(?:UL|20)(16|17|18)", path)
+    if match is None:
+        return "unknown"
+    era = "20" + match.group(1)
+    if era == "2016" and "APV" in path:
+        era += "APV"
+    return era
+
+
+def telemetryLine(record):
+    return TELEMETRY_PREFIX + json.dumps(record)
+
+
+def harvestTelemetry(logDir, historyPath):
+    """Append the telemetry of the logs in logDir to the history file; returns the number of new records."""
+    history = readHistory(historyPath)
+    seen = {record.get("log") for record in history}
+    new = []
+    for logPath in sorted(glob.glob(os.path.join(logDir, "*.out"))):
+        log = os.path.abspath(logPath) + f"@{os.path.getmtime(logPath):.0f}"
+        if log in seen:
+            continue
+        with open(logPath) as f:
+            for line in f:
+                if line.startswith(TELEMETRY_PREFIX):
+                    record = json.loads(line[len(TELEMETRY_PREFIX):])
+                    record["log"] = log
+                    new.append(record)
+    with open(historyPath, "a") as f:
+        for record in new:
+            f.write(json.dumps(record) + "\n")
+    return len(new)
+
+
+def readHistory(historyPath):
+    if not os.path.isfile(historyPath):
+        return []
+    with open(historyPath) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class CostModel:
+    def __init__(self, records):
+        rates = {}
+        memory = {}
+        for record in records:
+            if record["entries"] <= 0 or record["seconds"] <= 0:
+                continue
+            for key in self.keys(record["engine"], record["era"], record["lepton"]):
+                rates.setdefault(key, []).append(record["entries"] / record["seconds"])
+                memory.setdefault(key, []).append(record["maxRSSMB"])
+        self.rates = {key: float(np.median(values)) for key, values in rates.items()}
+        self.memory = {key: max(values) for key, values in memory.items()}
+        self.nJobs = len(records)
+
+    @staticmethod
+    def keys(engine, era, lepton):
+        return [(engine, era, lepton), (engine, lepton), (engine,)]
+
+    def lookup(self, table, engine, era, lepton):
+        for key in self.keys(engine, era, lepton):
+            if key in table:
+                return table[key]
+        return None
+
+    def eventsPerSecond(self, engine, era, lepton):
+        """Fitted processing rate, None without any history for the engine."""
+        return self.lookup(self.rates, engine, era, lepton)
+
+    def memoryMB(self, engine, era, lepton):
+        return self.lookup(self.memory, engine, era, lepton)
+
+
+def predictUnits(model, units, engine, lepton, defaultEventsPerSecond):
+    """Set the predicted "seconds" and "memoryMB" of every work unit, in place."""
+    for unit in units:
+        era = eraOf(unit["spec"])
+        rate = model.eventsPerSecond(engine, era, lepton) or defaultEventsPerSecond
+        unit["seconds"] = unit["entries"] / rate
+        unit["memoryMB"] = model.memoryMB(engine, era, lepton)
@@ -0,0 +1,64 @@
+import os
+import ROOT
+
+# C++ replacements for the Python helpers of the PyROOT event loops
+# (passes_lepton_cuts, dPhi, deltaR, is_leading_lepton_matched and the
+# leading-object scans), implemented in trigEffHelpers.h/.C.
+# The helpers are compiled with ACLiC into a cached library, so only the first
+# run (or a run after the sources change) pays for the compilation. Without a
+# usable compiler they are declared to the interpreter instead.
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trigEffHelpers.C")
+BUILD_DIR = os.environ.get("TRIGEFF_BUILD_DIR", os.path.join(os.path.expanduser("~"), ".cache", "trigEffHelpers"))
+
+_loaded = False
+
+
+def load():
+    global _loaded
+    if _loaded:
+        return
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    ROOT.gSystem.AddIncludePath(f"-I{os.path.dirname(SOURCE)}")
+    if ROOT.gSystem.CompileMacro(SOURCE, "kO", "", BUILD_DIR) != 1:
+        print(f"Could not compile {SOURCE}, declaring the C++ helpers to the interpreter instead")
+        ROOT.gInterpreter.Declare(f'#include "{SOURCE}"')
+    _loaded = True
+
+
+def dPhi(obj_phi, jet_phi):
+    return ROOT.trigeff.dPhi(obj_phi, jet_phi)
+
+
+def deltaR(eta1, phi1, eta2, phi2):
+    return ROOT.trigeff.deltaR(eta1, phi1, eta2, phi2)
+
+
+def passes_lepton_cuts(ev, lepton, leptonIndex):
+    if lepton == "Muon":
+        return ROOT.trigeff.passesMuonCutsLeaves(leptonIndex, ev.Muon_eta, ev.Muon_dz, ev.Muon_dxy,
+                                                  ev.Muon_tightId, ev.Muon_pfIsoId)
+    else:
+        return ROOT.trigeff.passesElectronCutsLeaves(leptonIndex, ev.Electron_eta, ev.Electron_dz, ev.Electron_dxy,
+                                                      ev.Electron_cutBased, ev.Electron_mvaFall17V2Iso_WP80)
+
+
+def leading_lepton_index(ev, lepton):
+    """Index of the highest-pT lepton passing passes_lepton_cuts, -1 if there is none."""
+    if lepton == "Muon":
+        return ROOT.trigeff.leadingMuonLeaves(ev.nMuon, ev.Muon_pt, ev.Muon_eta, ev.Muon_dz, ev.Muon_dxy,
+                                               ev.Muon_tightId, ev.Muon_pfIsoId)
+    else:
+        return ROOT.trigeff.leadingElectronLeaves(ev.nElectron, ev.Electron_pt, ev.Electron_eta, ev.Electron_dz,
+                                                   ev.Electron_dxy, ev.Electron_cutBased,
+                                                   ev.Electron_mvaFall17V2Iso_WP80)
+
+
+def leading_jet_index(ev):
+    """Index of the highest-pT jet passing passes_jet_cuts, -1 if there is none."""
+    return ROOT.trigeff.leadingJetLeaves(ev.nJet, ev.Jet_pt)
+
+
+def is_leading_lepton_matched(trigObj_eta, trigObj_phi, trigObj_id, trigObj_filterBits, lepton_eta, lepton_phi, lepton_type):
+    return ROOT.trigeff.leadingLeptonMatchedLeaves(len(trigObj_id), lepton_eta, lepton_phi, trigObj_eta, trigObj_phi,
+                                                   trigObj_id, trigObj_filterBits, lepton_type == "Electron")
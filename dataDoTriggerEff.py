@@ -3,7 +3,27 @@ import os, sys
 import argparse
 import numpy as np
 from array import array
-import json
+from lumiMask import load_lumi_mask
+from refCuts import REF_MET_CUT, refCutMaskForFile
+from trigEffUtils import popOption, selectionBranches, pruneBranches, emptyCounts, addCountsToHistos
+from trigEffUtils import parseInputFile, entryRange, iterEntries, iterEntryList
+from entryLists import ENTRY_LIST_MODES, persistEntryList, refEntries, refCutMaskCached
+
+# Event loop engine: pyroot (default) or columnar (uproot/awkward, reading the
+# jagged branches only where the reference cuts leave events, see columnarEff.py)
+engine = popOption(sys.argv, "--engine", "pyroot")
+if engine not in ["pyroot", "columnar"]:
+    raise ValueError(f"Unknown engine {engine}, use pyroot or columnar")
+# Loop for the pyroot engine: standard (default) or fast (branches bound to
+# numpy buffers, see fastLoop.py)
+loop = popOption(sys.argv, "--loop", "standard")
+if loop not in ["standard", "fast"]:
+    raise ValueError(f"Unknown loop {loop}, use standard or fast")
+# Persisted entry lists of the reference-passing events (see entryLists.py), opt-in:
+# off (default), auto (persisted for whole files only) or on (for entry ranges too)
+entryLists = popOption(sys.argv, "--entry-lists", "off")
+if entryLists not in ENTRY_LIST_MODES:
+    raise ValueError(f"Unknown entry-lists {entryLists}, use off, auto or on")
 
 # Define lepton type
 lepton = sys.argv[1] # Electron or Muon
@@ -33,7 +53,7 @@ if lepton == "Muon":
     if data == "mc":
         hlt = ["HLT_IsoMu27", "HLT_Mu50"]
     else:
-        hlt = refhlt
+        hlt = [refhlt]
     offlineCuts = {
         "lep1pt": 40,
         "MET": 40,
@@ -61,7 +81,7 @@ else:  # Electron-specific configurations
         else:
             hlt = ["HLT_Ele32_WPTight_Gsf", "HLT_Ele115_CaloIdVT_GsfTrkIdT", "HLT_Photon175"]
     else:
-        hlt = refhlt
+        hlt = [refhlt]
     offlineCuts = {
         "lep1pt": 30,
         "MET": 40,
@@ -81,37 +101,9 @@ else:  # Electron-specific configurations
     eta_bins = ["eta1", "eta2", "eta3"]
     eta_ranges = [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0)]
 
-# loads lumi masks
-
-def load_lumi_mask(file_path):
-    with open(file_path, 'r') as f:
-        goldenJSONDict = json.load(f)
-
-    def mask(run, luminosityBlock):
-        mask_array = np.zeros_like(run, dtype=bool)
-        for i in range(len(run)):
-            run_str = str(run[i])
-            if run_str in goldenJSONDict:
-                goodIntervals = goldenJSONDict[run_str]
-                for interval in goodIntervals:
-                    min_lumi, max_lumi = interval
-                    if min_lumi <= luminosityBlock[i] <= max_lumi:
-                        mask_array[i] = True
-                        break
-        return mask_array
-
-    return mask
-
-# Checks reference cuts for data
-def passRefCut(events, era):
-    print(f"Checking reference cuts for era: {era}")
-
-    # Load run and luminosity block branches
-    run = np.array([event.run for event in events])
-    luminosityBlock = np.array([event.luminosityBlock for event in events])
-
-
-    # Apply lumi mask
+# Loads the lumi mask for the era once; the reference cuts themselves
+# (lumi mask, MET_pt > 150, MET filters) are evaluated once per file in refCuts.py
+if data == "data":
     if era == "2016" or era == "2016APV":
         LumiJSON = load_lumi_mask("/eos/user/r/rresendi/Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt")
     elif era == "2016apv":
@@ -123,43 +115,6 @@ def passRefCut(events, era):
     else:
         raise ValueError("No era is defined. Please specify the year")
 
-    lumi_mask = LumiJSON(run, luminosityBlock)
-    selected_events = [event for i, event in enumerate(events) if lumi_mask[i]]
-
-    # Apply the MET cut
-    selected_events = [event for event in selected_events if event.MET_pt > 150]
-
-    # Apply quality filters
-    if era == "2018" or era == "2017":
-        cutAnyFilter = (
-            (events["Flag_goodVertices"])
-            & (events["Flag_globalSuperTightHalo2016Filter"])
-            & (events["Flag_HBHENoiseFilter"])
-            & (events["Flag_HBHENoiseIsoFilter"])
-            & (events["Flag_EcalDeadCellTriggerPrimitiveFilter"])
-            & (events["Flag_BadPFMuonFilter"])
-            & (events["Flag_BadPFMuonDzFilter"])
-            & (events["Flag_eeBadScFilter"])
-            & (events["Flag_ecalBadCalibFilter"])
-        )
-    elif era == "2016" or era == "2016APV":
-        cutAnyFilter = (
-            (events["Flag_goodVertices"])
-            & (events["Flag_globalSuperTightHalo2016Filter"])
-            & (events["Flag_HBHENoiseFilter"])
-            & (events["Flag_HBHENoiseIsoFilter"])
-            & (events["Flag_EcalDeadCellTriggerPrimitiveFilter"])
-            & (events["Flag_BadPFMuonFilter"])
-            & (events["Flag_BadPFMuonDzFilter"])
-            & (events["Flag_eeBadScFilter"])
-        )
-    else:
-        raise ValueError("Unsupported era for quality filters")
-
-    events = selected_events[cutAnyFilter]
-
-    return events
-
 # Create the actual histograms for saving
 histos = {}
 
@@ -254,28 +209,71 @@ print("Starting %s" % inputFiles)
 inF = 0
 nF  = len (inputFiles)
 
+selection = {
+    "lepton": lepton, "data": data, "era": era, "etaOption": etaOption,
+    "hlt": hlt, "refhlt": None, "offlineCuts": offlineCuts,
+    "histBins": histBins, "eta_bins": eta_bins, "eta_ranges": eta_ranges,
+    "refMetCut": REF_MET_CUT,
+    "dRVeto": False, "metJetVetoAlways": False, "refInNum": False, "refInDen": False,
+}
+
+if engine == "columnar":
+    import columnarEff
+    counts = emptyCounts(histBins, etaOption, eta_bins)
+elif loop == "fast":
+    import fastLoop
+else:
+    # Only the branches used by the selection are read; the reference cuts come from the entry list
+    loopBranches = selectionBranches(lepton, hlt)
+
 for iFile in inputFiles:
      inF += 1
      print("Starting file %i/%i, %s" % (inF, nF, iFile))
-     tf = ROOT.TFile(iFile, "READ")
+     path, entryStart, entryStop = parseInputFile(iFile)
+
+     # The columnar engine and the fast loop process the whole file
+     if engine == "columnar":
+         if data == "data" and entryLists != "off":
+             passing = refEntries(path, era, LumiJSON, REF_MET_CUT, entryStart, entryStop,
+                                  useCache=persistEntryList(entryLists, entryStart, entryStop))
+         else:
+             passing = None
+         columnarEff.processFile(path, selection, LumiJSON if data == "data" else None, counts,
+                                 entryStart=entryStart, entryStop=entryStop, refEntries=passing)
+         continue
+     if loop == "fast":
+         refMaskForFile = refCutMaskCached if persistEntryList(entryLists, entryStart, entryStop) else refCutMaskForFile
+         refMask = refMaskForFile(path, era, LumiJSON, entryStart=entryStart, entryStop=entryStop) if data == "data" else None
+         stats = fastLoop.processFile(path, selection, histos, refMask, entryStart, entryStop)
+         continue
+
+     tf = ROOT.TFile(path, "READ")
      events = tf.Get("Events")
+     pruneBranches(events, loopBranches)
 
      # Event counter
      iEv = 0
      # Total number of events
-     nEv = events.GetEntries()
+     # Whole file or entry range as given, before the range is resolved
+     persist = persistEntryList(entryLists, entryStart, entryStop)
+     entryStart, entryStop = entryRange(events.GetEntries(), entryStart, entryStop)
+     nEv = entryStop - entryStart
+
+     # Only the entries passing the reference cuts are visited for data
+     if data == "data":
+         entries = iterEntryList(events, refEntries(path, era, LumiJSON, REF_MET_CUT, entryStart, entryStop,
+                                                    useCache=persist))
+     else:
+         entries = iterEntries(events, entryStart, entryStop)
 
      muon_below27 = 0
      electron_below32 = 0
 
-     for ev in events:
+     for ev in entries:
          if iEv % 1000 == 0:
              print("%i/%i events in file done" % (iEv, nEv))
          iEv += 1
-         if(iEv % 1000 == 0): break
-
-         if data == "data":
-             if not (passRefCut(ev, era)): continue
+         #if(iEv % 1000 == 0): break
 
          passHLT = False
          # Check if we pass numerator
@@ -412,6 +410,9 @@ for iFile in inputFiles:
 
      tf.Close()
 
+if engine == "columnar":
+    addCountsToHistos(histos, counts)
+
 for var in histBins:
     if etaOption == "Eta":
         for eta_bin in eta_bins:
@@ -1,8 +1,47 @@
 import ROOT
 import os, sys
+import json
+import resource
+import time
 import argparse
 import numpy as np
 from array import array
+from trigEffUtils import popOption, selectionBranches, pruneBranches, addCountsToHistos, histoCounts, mapFiles, emptyCounts
+from trigEffUtils import parseInputFile, entryRange, iterEntries
+from costModel import engineKey, eraOf, telemetryLine
+from provenance import configHash, provenanceRecord
+from histCache import loadCounts, storeCounts
+
+startTime = time.time()
+
+# Event loop engine: pyroot (default) or rdf (RDataFrame with implicit MT, see rdfEff.py)
+engine = popOption(sys.argv, "--engine", "pyroot")
+if engine not in ["pyroot", "rdf"]:
+    raise ValueError(f"Unknown engine {engine}, use pyroot or rdf")
+# Number of threads for the rdf engine, 0 = all available cores
+nThreads = int(popOption(sys.argv, "--threads", "0"))
+# Helpers for the pyroot engine: python (default) or cpp (see cppHelpers.py)
+helpers = popOption(sys.argv, "--helpers", "python")
+if helpers not in ["python", "cpp"]:
+    raise ValueError(f"Unknown helpers {helpers}, use python or cpp")
+# Loop for the pyroot engine: standard (default) or fast (branches bound to
+# numpy buffers, see fastLoop.py)
+loop = popOption(sys.argv, "--loop", "standard")
+if loop not in ["standard", "fast"]:
+    raise ValueError(f"Unknown loop {loop}, use standard or fast")
+# Number of worker processes the input files are spread over (1 = in this process);
+# the rdf engine uses --threads instead
+workers = int(popOption(sys.argv, "--workers", "1"))
+if workers > 1 and engine == "rdf":
+    raise ValueError("--workers is for the pyroot engine, the rdf engine runs multithreaded with --threads")
+# Per-file histogram cache of the pyroot engine (see histCache.py), opt-in: off (default) or on
+histCache = popOption(sys.argv, "--hist-cache", "off")
+if histCache not in ["on", "off"]:
+    raise ValueError(f"Unknown hist-cache {histCache}, use on or off")
+# --config-hash: only print the hash of the selection configuration (see provenance.py) and exit
+printConfigHash = "--config-hash" in sys.argv
+if printConfigHash:
+    sys.argv.remove("--config-hash")
 
 # Define lepton type
 lepton = sys.argv[1] # Electron or Muon
@@ -85,6 +124,15 @@ else:  # Electron-specific configurations
     # event filter
    #return True if all passes, or return False if fails any of the cuts
 
+# Selection configuration recorded in the output provenance
+selectionConfig = {
+    "lepton": lepton, "data": data, "etaOption": etaOption, "hlt": hlt, "offlineCuts": offlineCuts,
+    "histBins": histBins, "eta_bins": eta_bins, "eta_ranges": eta_ranges,
+}
+if printConfigHash:
+    print(configHash(selectionConfig))
+    sys.exit(0)
+
 # Create the actual histograms for saving
 histos = {}
 
@@ -172,27 +220,49 @@ def get_eta_bin(eta):
             return eta_bins[i]
     return None
 
+# Swap in the C++ helpers (trigEffHelpers.C, compiled once and cached)
+if helpers == "cpp":
+    import cppHelpers
+    cppHelpers.load()
+    passes_lepton_cuts = cppHelpers.passes_lepton_cuts
+    dPhi = cppHelpers.dPhi
+    deltaR = cppHelpers.deltaR
+    is_leading_lepton_matched = cppHelpers.is_leading_lepton_matched
+
 # Now loop over the events
 print("Starting %s" % inputFiles)
 
 inF = 0
 nF  = len (inputFiles)
 
-for iFile in inputFiles:
-     inF += 1
-     print("Starting file %i/%i, %s" % (inF, nF, iFile))
-     tf = ROOT.TFile(iFile, "READ")
+selection = {
+    "lepton": lepton, "etaOption": etaOption, "hlt": hlt, "offlineCuts": offlineCuts,
+    "histBins": histBins, "eta_bins": eta_bins, "eta_ranges": eta_ranges,
+    "refhlt": None, "dRVeto": False, "metJetVetoAlways": False, "refInNum": False, "refInDen": False,
+}
+
+# Only the branches used by the selection are read by the standard loop
+loopBranches = selectionBranches(lepton, hlt)
+
+if loop == "fast":
+    import fastLoop
+
+def loopFile(path, entryStart=0, entryStop=None):
+     """Standard PyROOT loop over one file (entries entryStart to entryStop), filling histos; returns the cutflow numbers."""
+     tf = ROOT.TFile(path, "READ")
      events = tf.Get("Events")
+     pruneBranches(events, loopBranches)
 
      # Event counter
      iEv = 0
      # Total number of events
-     nEv = events.GetEntries()
+     entryStart, entryStop = entryRange(events.GetEntries(), entryStart, entryStop)
+     nEv = entryStop - entryStart
 
      muon_below27 = 0
      electron_below32 = 0
 
-     for ev in events:
+     for ev in iterEntries(events, entryStart, entryStop):
          if iEv % 1000 == 0:
              print("%i/%i events in file done" % (iEv, nEv))
          iEv += 1
@@ -219,11 +289,16 @@ for iFile in inputFiles:
          leptons_eta = np.array(getattr(ev, lepton + "_eta"))
          leptons_phi = np.array(getattr(ev, lepton + "_phi"))
 
-         for leptonIndex in range(getattr(ev, "n" + lepton)):
-             if passes_lepton_cuts(ev, lepton, leptonIndex):
-                 if getattr(ev, lepton + "_pt")[leptonIndex] > highest_pt:
-                     highest_pt = getattr(ev, lepton + "_pt")[leptonIndex]
-                     highest_pt_lepton_index = leptonIndex
+         if helpers == "cpp":
+             highest_pt_lepton_index = cppHelpers.leading_lepton_index(ev, lepton)
+             if highest_pt_lepton_index != -1:
+                 highest_pt = getattr(ev, lepton + "_pt")[highest_pt_lepton_index]
+         else:
+             for leptonIndex in range(getattr(ev, "n" + lepton)):
+                 if passes_lepton_cuts(ev, lepton, leptonIndex):
+                     if getattr(ev, lepton + "_pt")[leptonIndex] > highest_pt:
+                         highest_pt = getattr(ev, lepton + "_pt")[leptonIndex]
+                         highest_pt_lepton_index = leptonIndex
 
          # If no valid lepton found, continue to the next event
          if highest_pt_lepton_index == -1:
@@ -232,11 +307,14 @@ for iFile in inputFiles:
          #finds leading jet
          highest_jet_pt = -1
          highest_jet_pt_index = -1
-         for jetIndex in range(ev.nJet):
-             if passes_jet_cuts(ev, jetIndex):
-                 if ev.Jet_pt[jetIndex] > highest_jet_pt:
-                     highest_jet_pt = ev.Jet_pt[jetIndex]
-                     highest_jet_pt_index = jetIndex
+         if helpers == "cpp":
+             highest_jet_pt_index = cppHelpers.leading_jet_index(ev)
+         else:
+             for jetIndex in range(ev.nJet):
+                 if passes_jet_cuts(ev, jetIndex):
+                     if ev.Jet_pt[jetIndex] > highest_jet_pt:
+                         highest_jet_pt = ev.Jet_pt[jetIndex]
+                         highest_jet_pt_index = jetIndex
 
          if highest_jet_pt_index == -1:
             continue
@@ -337,6 +415,77 @@ for iFile in inputFiles:
                         histos[var + "_num"].Fill(fillvar)
 
      tf.Close()
+     return {"nEv": nEv, "below": muon_below27 + electron_below32}
+
+def processInputFile(iFile):
+    """Fill histos from one input file (or entry range, see parseInputFile) with the selected loop.
+
+    Returns the cutflow numbers.
+    """
+    path, entryStart, entryStop = parseInputFile(iFile)
+    if loop == "fast":
+        return fastLoop.processFile(path, selection, histos, entryStart=entryStart, entryStop=entryStop)
+    else:
+        return loopFile(path, entryStart, entryStop)
+
+def countInputFile(iFile):
+    """processInputFile on reset histograms, returning the histogram contents as arrays.
+
+    With the histogram cache, unchanged files are not processed again.
+    """
+    if histCache == "on":
+        cached = loadCounts(iFile, configHash(selectionConfig))
+        if cached is not None:
+            print(f"Histograms of {iFile} from the cache")
+            return iFile, cached[0], {**cached[1], "cached": True}
+    for h in histos.values():
+        h.Reset()
+    stats = processInputFile(iFile)
+    counts = histoCounts(histos)
+    if histCache == "on":
+        storeCounts(iFile, configHash(selectionConfig), counts, stats)
+    return iFile, counts, stats
+
+nEntries = 0
+if engine == "rdf":
+    import rdfEff
+    results, belowThreshold = rdfEff.bookHistos(inputFiles, selection, nThreads)
+    # The first GetValue runs the single event loop that fills everything booked
+    for name in results:
+        histos[name].Add(results[name].GetValue())
+    muon_below27 = belowThreshold["Muon"].GetValue() if lepton == "Muon" else 0
+    electron_below32 = belowThreshold["Electron"].GetValue() if lepton == "Electron" else 0
+    chain = ROOT.TChain("Events")
+    for iFile in inputFiles:
+        chain.Add(iFile)
+    nEntries = chain.GetEntries()
+elif workers > 1 or histCache == "on":
+    # The histograms are reset for every file: the per-file counts are summed here
+    totals = emptyCounts(histBins, etaOption, eta_bins)
+    results = mapFiles(countInputFile, inputFiles, workers) if workers > 1 else map(countInputFile, inputFiles)
+    for iFile, counts, stats in results:
+        inF += 1
+        print("Finished file %i/%i, %s" % (inF, nF, iFile))
+        for name in totals:
+            totals[name] += counts[name]
+        # Telemetry counts the events actually read
+        if not stats.get("cached", False):
+            nEntries += stats["nEv"]
+        # Like the serial loop, report the counts of the last file
+        muon_below27 = stats["below"] if lepton == "Muon" else 0
+        electron_below32 = stats["below"] if lepton == "Electron" else 0
+    for h in histos.values():
+        h.Reset()
+    addCountsToHistos(histos, totals)
+else:
+    for iFile in inputFiles:
+        inF += 1
+        print("Starting file %i/%i, %s" % (inF, nF, iFile))
+        stats = processInputFile(iFile)
+        nEntries += stats["nEv"]
+        # Report the counts of the last file
+        muon_below27 = stats["below"] if lepton == "Muon" else 0
+        electron_below32 = stats["below"] if lepton == "Electron" else 0
 
 for var in histBins:
     if etaOption == "Eta":
@@ -350,6 +499,7 @@ for var in histBins:
 outF = ROOT.TFile(outputHistos, "RECREATE")
 for h in histos:
     histos[h].Write()
+ROOT.TObjString(json.dumps(provenanceRecord(inputFiles, selectionConfig))).Write("provenance")
 outF.Close()
 
 
@@ -357,3 +507,11 @@ outF.Close()
 print("Number of muon events with pT < 27 GeV: ", muon_below27)
 print("Number of electron events with pT < 32 GeV: ", electron_below32)
 print("Processing complete. Output written to %s" % outputHistos)
+
+# Job telemetry, read back from the batch logs by p3submitJobs.py (see costModel.py)
+maxRSS = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+print(telemetryLine({
+    "entries": nEntries, "seconds": round(time.time() - startTime, 1), "maxRSSMB": round(maxRSS / 1024, 1),
+    "engine": engineKey(engine, loop), "era": eraOf(parseInputFile(inputFiles[0])[0]) if inputFiles else "unknown",
+    "lepton": lepton, "files": len(inputFiles),
+}))
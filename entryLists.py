@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from refCuts import REF_MET_CUT, refCutMaskForFile
+
+# Persisted entry lists of the events passing the data reference cuts.
+# A run over an input file (or entry range) stores the sorted entry numbers of
+# its passing events in CACHE_DIR, keyed by the file's path, size and mtime,
+# the entry range, the era, the MET cut and the lumi mask; later runs over
+# the same input (any script) read the list back instead of evaluating the
+# cuts, and their event loops only visit the listed entries. Only the entry
+# range being processed is ever read. A changed file gets a new key, so a
+# stale list is never used. Files that can't be stat'ed (root:// URLs) are not
+# cached.
+#
+# Nothing evicts the lists, so they are opt-in. The --entry-lists option of
+# the scripts:
+#   off   (default) nothing is written to CACHE_DIR, the reference cuts are
+#         evaluated for every run
+#   auto  persist the lists of whole files only: the entry ranges of split
+#         batch jobs are processed once, in a scratch HOME
+#   on    persist every list
+
+ENTRY_LIST_MODES = ["off", "auto", "on"]
+CACHE_DIR = os.environ.get("TRIGEFF_ENTRYLIST_DIR", os.path.join(os.path.expanduser("~"), ".cache", "trigEffEntryLists"))
+
+
+def persistEntryList(mode, entryStart, entryStop):
+    """Whether the entry list of an input is kept in CACHE_DIR for an --entry-lists mode."""
+    return mode == "on" or (mode == "auto" and entryStart == 0 and entryStop is None)
+
+
+def entryListKey(path, era, metCut, lumi_mask, entryStart, entryStop):
+    stat = os.stat(path)
+    identity = [os.path.abspath(path), stat.st_size, int(stat.st_mtime), entryStart, entryStop,
+                era, metCut, lumi_mask.fingerprint()]
+    return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+
+def cachedRefEntries(path, era, lumi_mask, metCut=REF_MET_CUT, entryStart=0, entryStop=None):
+    """(sorted entry numbers passing the reference cuts, number of entries) of entries entryStart to entryStop."""
+    try:
+        cachePath = os.path.join(CACHE_DIR, entryListKey(path, era, metCut, lumi_mask, entryStart, entryStop) + ".npz")
+    except OSError:
+        cachePath = None
+    if cachePath is not None and os.path.exists(cachePath):
+        try:
+            with np.load(cachePath) as cached:
+                return cached["entries"], int(cached["nEntries"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    mask = refCutMaskForFile(path, era, lumi_mask, metCut, entryStart=entryStart, entryStop=entryStop)
+    entries = np.flatnonzero(mask).astype(np.int64) + entryStart
+    if cachePath is not None:
+        # Written atomically; an unwritable cache is not an error
+        tmp = f"{cachePath}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.savez(f, entries=entries, nEntries=len(mask))
+            os.replace(tmp, cachePath)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return entries, len(mask)
+
+
+def refEntries(path, era, lumi_mask, metCut=REF_MET_CUT, entryStart=0, entryStop=None, useCache=True):
+    """Sorted entry numbers within entryStart to entryStop of the events passing the reference cuts."""
+    if useCache:
+        return cachedRefEntries(path, era, lumi_mask, metCut, entryStart, entryStop)[0]
+    mask = refCutMaskForFile(path, era, lumi_mask, metCut, entryStart=entryStart, entryStop=entryStop)
+    return np.flatnonzero(mask) + entryStart
+
+
+def refCutMaskCached(path, era, lumi_mask, metCut=REF_MET_CUT, entryStart=0, entryStop=None):
+    """refCutMaskForFile from the persisted entry list."""
+    entries, nEntries = cachedRefEntries(path, era, lumi_mask, metCut, entryStart, entryStop)
+    mask = np.zeros(nEntries, dtype=bool)
+    mask[entries - entryStart] = True
+    return mask
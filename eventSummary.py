@@ -0,0 +1,54 @@
+import json
+import numpy as np
+import uproot
+
+from columnarEff import offlineCutFlags
+
+# Per-event summary ntuple of the columnar selection.
+# for_data.py --summary summary.root (columnar engine) writes, next to its
+# histograms, a flat Summary tree with one row per event reaching the
+# histogram filling (leading lepton and jet found, vetoes passed): the leading
+# lepton pT/eta/phi, MET, MET phi and mT, the bit of every HLT path, the
+# reference trigger bit, the trigger-object match and the offline cut
+# decisions. The selection configuration is stored as a "summaryConfig"
+# TObjString. reHisto.py builds num/den histograms with any binning, eta
+# ranges or offline cuts from it, without reprocessing the NanoAOD.
+
+SUMMARY_TREE = "Summary"
+VALUE_COLUMNS = ["lep1pt", "lep1eta", "lep1phi", "MET", "MET_phi", "mT"]
+FLAG_COLUMNS = ["matched", "passRef", "passLepCut", "passMETCut", "passMTCut"]
+
+
+def summaryTypes(cfg):
+    types = {name: np.float64 for name in VALUE_COLUMNS}
+    types.update({name: np.bool_ for name in FLAG_COLUMNS + list(cfg["hlt"])})
+    return types
+
+
+def summaryColumns(chunks, cfg):
+    """The column chunks collected by columnarEff.processFile as one array per column, with the cut flags."""
+    types = summaryTypes(cfg)
+    sources = [name for name in types if name not in ["passLepCut", "passMETCut", "passMTCut"]]
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks] + [np.zeros(0, dtype=types[name])]).astype(types[name])
+               for name in sources}
+    columns["passLepCut"], columns["passMETCut"], columns["passMTCut"] = offlineCutFlags(columns, cfg["offlineCuts"])
+    return {name: columns[name] for name in types}
+
+
+def writeSummary(path, chunks, cfg):
+    """Write the Summary tree and the selection configuration; returns the number of rows."""
+    columns = summaryColumns(chunks, cfg)
+    with uproot.recreate(path) as f:
+        tree = f.mktree(SUMMARY_TREE, summaryTypes(cfg))
+        if len(columns["lep1pt"]):
+            tree.extend(columns)
+        f["summaryConfig"] = json.dumps(cfg, default=list)
+    return len(columns["lep1pt"])
+
+
+def readSummary(path):
+    """(columns as numpy arrays, selection configuration) of a summary file."""
+    with uproot.open(path) as f:
+        cfg = json.loads(str(f["summaryConfig"]))
+        columns = f[SUMMARY_TREE].arrays(library="np")
+    return columns, cfg
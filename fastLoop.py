@@ -0,0 +1,209 @@
+import numpy as np
+import ROOT
+
+from trigEffUtils import selectionBranches, pruneBranches, entryRange
+
+# Optimized PyROOT event loop.
+# The branches used by the selection are bound once per file to numpy buffers
+# with SetBranchAddress, so each GetEntry fills them in place and the loop only
+# works on zero-copy slices of those buffers. Per-event quantities (lepton cuts,
+# leading indices, mT, the offline cut flags) are computed once and reused for
+# every histBins variable.
+#
+# The selection variants of the scripts are chosen by flags in cfg:
+#   dRVeto           veto events with deltaR(lepton, jet) < 0.5 (for_data.py)
+#   metJetVetoAlways apply the dPhi(MET, jet) veto to all events, not only to
+#                    those passing the MET cut (for_data.py)
+#   refInNum         require the reference trigger in the numerator (for_data.py)
+#   refInDen         require the reference trigger in the denominator
+
+LEAF_DTYPES = {
+    "Float_t": np.float32, "Double_t": np.float64,
+    "Int_t": np.int32, "UInt_t": np.uint32,
+    "Short_t": np.int16, "UShort_t": np.uint16,
+    "Char_t": np.int8, "UChar_t": np.uint8,
+    "Long64_t": np.int64, "ULong64_t": np.uint64,
+    "Bool_t": np.bool_,
+}
+
+VARS = ["lep1pt", "MET", "mT", "lep1phi", "MET phi"]
+
+
+class BoundBranches:
+    """numpy buffers attached to tree branches with SetBranchAddress."""
+
+    def __init__(self, tree, names):
+        self.tree = tree
+        self.buffers = {}
+        for name in names:
+            leaf = tree.GetLeaf(name)
+            countLeaf = leaf.GetLeafCount()
+            size = max(int(countLeaf.GetMaximum()), 1) if countLeaf else max(leaf.GetLenStatic(), 1)
+            buf = np.zeros(size, dtype=LEAF_DTYPES[leaf.GetTypeName()])
+            tree.SetBranchAddress(name, buf)
+            self.buffers[name] = buf
+
+    def __getitem__(self, name):
+        return self.buffers[name]
+
+    def release(self):
+        self.tree.ResetBranchAddresses()
+
+
+def leptonCuts(b, lepton, n):
+    """passes_lepton_cuts for the first n leptons of the current entry."""
+    if lepton == "Muon":
+        absEta = np.abs(b["Muon_eta"][:n].astype(np.float64))
+        return (
+            b["Muon_tightId"][:n].astype(bool)
+            & (absEta < 2.4)
+            & (np.abs(b["Muon_dz"][:n].astype(np.float64)) <= 0.05)
+            & (np.abs(b["Muon_dxy"][:n].astype(np.float64)) <= 0.02)
+            & (b["Muon_pfIsoId"][:n] >= 5))
+    else:
+        absEta = np.abs(b["Electron_eta"][:n].astype(np.float64))
+        wide = absEta > 1.479
+        return (
+            (b["Electron_cutBased"][:n] >= 2)
+            & b["Electron_mvaFall17V2Iso_WP80"][:n].astype(bool)
+            & (np.abs(b["Electron_dxy"][:n].astype(np.float64)) < 0.05 + 0.05 * wide)
+            & (np.abs(b["Electron_dz"][:n].astype(np.float64)) < 0.10 + 0.10 * wide)
+            & ((absEta < 1.444) | (absEta > 1.566))
+            & (absEta < 2.5))
+
+
+def processFile(iFile, cfg, histos, refMask=None, entryStart=0, entryStop=None):
+    """Fill histos from entries entryStart to entryStop of one file.
+
+    refMask holds the data reference cuts, one per entry of that range.
+    """
+    lepton = cfg["lepton"]
+    offlineCuts = cfg["offlineCuts"]
+    isElectron = lepton == "Electron"
+
+    tf = ROOT.TFile.Open(iFile, "READ")
+    tree = tf.Get("Events")
+    entryStart, entryStop = entryRange(tree.GetEntries(), entryStart, entryStop)
+    nEv = entryStop - entryStart
+
+    # Only the bound branches are read; reference cuts come in through refMask
+    active = pruneBranches(tree, selectionBranches(lepton, cfg["hlt"], cfg["refhlt"]))
+    hltPaths = [path for path in cfg["hlt"] if path in active]
+    refhlt = cfg["refhlt"] if cfg["refhlt"] in active else None
+    b = BoundBranches(tree, active)
+
+    # Buffers bound once per file
+    nLep, lepPt, lepEta, lepPhi = b["n" + lepton], b[lepton + "_pt"], b[lepton + "_eta"], b[lepton + "_phi"]
+    nJet, jetPt, jetEta, jetPhi = b["nJet"], b["Jet_pt"], b["Jet_eta"], b["Jet_phi"]
+    nTrig, trigEta, trigPhi = b["nTrigObj"], b["TrigObj_eta"], b["TrigObj_phi"]
+    trigId, trigBits = b["TrigObj_id"], b["TrigObj_filterBits"]
+    metPtBuf, metPhiBuf = b["MET_pt"], b["MET_phi"]
+    hltBufs = [b[path] for path in hltPaths]
+    refBuf = b[refhlt] if refhlt else None
+
+    # (den, num) histograms per eta bin and variable, looked up once
+    histVars = [var for var in VARS if var in cfg["histBins"]]
+    if cfg["etaOption"] == "Eta":
+        targets = [[(histos[f"{eta_bin}_{var}_den"], histos[f"{eta_bin}_{var}_num"]) for var in histVars]
+                   for eta_bin in cfg["eta_bins"]]
+    else:
+        targets = [[(histos[var + "_den"], histos[var + "_num"]) for var in histVars]]
+
+    # Leading leptons below the single-lepton trigger thresholds
+    belowThreshold = 27 if lepton == "Muon" else 32
+    stats = {"nEv": nEv, "ref": 0, "lepton": 0, "jet": 0, "below": 0}
+    for iEv in range(nEv):
+        if (iEv + 1) % 1000 == 0:
+            print(f"{iEv + 1}/{nEv} events in file processed")
+        if refMask is not None and not refMask[iEv]:
+            continue
+        tree.GetEntry(entryStart + iEv)
+        stats["ref"] += 1
+
+        # Leading lepton
+        n = int(nLep[0])
+        candidates = np.flatnonzero(leptonCuts(b, lepton, n))
+        if len(candidates) == 0:
+            continue
+        lepIdx = candidates[np.argmax(lepPt[candidates])]
+        stats["lepton"] += 1
+
+        # Leading jet
+        candidates = np.flatnonzero(jetPt[:int(nJet[0])] > 60)
+        if len(candidates) == 0:
+            continue
+        jetIdx = candidates[np.argmax(jetPt[candidates])]
+        stats["jet"] += 1
+
+        highest_pt = float(lepPt[lepIdx])
+        lepton_eta = float(lepEta[lepIdx])
+        lepton_phi = float(lepPhi[lepIdx])
+        jet_eta = float(jetEta[jetIdx])
+        jet_phi = float(jetPhi[jetIdx])
+        met = float(metPtBuf[0])
+        met_phi = float(metPhiBuf[0])
+
+        if cfg["dRVeto"]:
+            dphi = np.arctan2(np.sin(lepton_phi - jet_phi), np.cos(lepton_phi - jet_phi))
+            if np.sqrt((lepton_eta - jet_eta)**2 + dphi**2) < 0.5:
+                continue
+        if np.arccos(np.cos(lepton_phi - jet_phi)) < 1.5:
+            continue
+        passmetCut = met >= offlineCuts["MET"]
+        if (cfg["metJetVetoAlways"] or passmetCut) and np.arccos(np.cos(met_phi - jet_phi)) < 1.5:
+            continue
+
+        # Match the leading lepton to trigger objects
+        nt = int(nTrig[0])
+        ids = np.abs(trigId[:nt])
+        bits = trigBits[:nt]
+        if isElectron:
+            good = (ids == 11) & (((bits & 2) == 2) | ((bits & 2048) == 2048) | ((bits & 8192) == 8192))
+        else:
+            good = (ids == 13) & ((((bits & 2) == 2) & ((bits & 8) == 8)) | ((bits & 1024) == 1024))
+        lepton_matched = False
+        if good.any():
+            dphi = lepton_phi - trigPhi[:nt][good].astype(np.float64)
+            dphi = np.arctan2(np.sin(dphi), np.cos(dphi))
+            dR = np.sqrt((lepton_eta - trigEta[:nt][good].astype(np.float64))**2 + dphi**2)
+            lepton_matched = bool((dR < 0.1).any())
+
+        if highest_pt < belowThreshold:
+            stats["below"] += 1
+
+        passRef = bool(refBuf[0]) if refBuf is not None else False
+        passHLT = any(bool(buf[0]) for buf in hltBufs)
+        passlepCut = highest_pt >= offlineCuts["lep1pt"]
+        mT = np.sqrt(2 * highest_pt * met * (1 - np.cos(np.arccos(np.cos(lepton_phi - met_phi)))))
+        passmtCut = offlineCuts["mT"][0] < mT < offlineCuts["mT"][1]
+
+        if cfg["etaOption"] == "Eta":
+            etaBin = None
+            for i, (low, high) in enumerate(cfg["eta_ranges"]):
+                if low <= abs(lepton_eta) < high:
+                    etaBin = i
+                    break
+            if etaBin is None:
+                continue
+        else:
+            etaBin = 0
+
+        passDenRef = passRef or not cfg["refInDen"]
+        passNum = passHLT and lepton_matched and (passRef or not cfg["refInNum"])
+        perVar = {
+            "lep1pt": (passmetCut and passmtCut, highest_pt),
+            "MET": (passlepCut and passmtCut, met),
+            "mT": (passlepCut and passmetCut, mT),
+            "lep1phi": (passmetCut and passmtCut and passlepCut, lepton_phi),
+            "MET phi": (passmetCut and passmtCut and passlepCut, met_phi),
+        }
+        for var, (hDen, hNum) in zip(histVars, targets[etaBin]):
+            passDen, fillvar = perVar[var]
+            if passDen and passDenRef:
+                hDen.Fill(fillvar)
+                if passNum:
+                    hNum.Fill(fillvar)
+
+    b.release()
+    tf.Close()
+    return stats
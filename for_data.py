@@ -3,7 +3,45 @@ import os, sys
 import argparse
 import numpy as np
 from array import array
-import json
+from lumiMask import load_lumi_mask
+from trigEffUtils import popOption, emptyCounts, addCountsToHistos, selectionBranches, pruneBranches, histoCounts, mapFiles
+from trigEffUtils import parseInputFile, entryRange, iterEntries, iterEntryList
+from entryLists import ENTRY_LIST_MODES, persistEntryList, refEntries, refCutMaskCached
+from histCache import loadCounts, storeCounts
+from provenance import configHash
+
+# Event loop engine: pyroot (default), columnar (uproot/awkward, see columnarEff.py)
+# or numba (jitted per-event kernel over the same chunks, see numbaEff.py)
+engine = popOption(sys.argv, "--engine", "pyroot")
+if engine not in ["pyroot", "columnar", "numba"]:
+    raise ValueError(f"Unknown engine {engine}, use pyroot, columnar or numba")
+# Helpers for the pyroot engine: python (default) or cpp (see cppHelpers.py)
+helpers = popOption(sys.argv, "--helpers", "python")
+if helpers not in ["python", "cpp"]:
+    raise ValueError(f"Unknown helpers {helpers}, use python or cpp")
+# Loop for the pyroot engine: standard (default) or fast (branches bound to
+# numpy buffers, see fastLoop.py)
+loop = popOption(sys.argv, "--loop", "standard")
+if loop not in ["standard", "fast"]:
+    raise ValueError(f"Unknown loop {loop}, use standard or fast")
+# Number of worker processes the input files are spread over (1 = in this process)
+workers = int(popOption(sys.argv, "--workers", "1"))
+# Persisted entry lists of the reference-passing events (see entryLists.py), opt-in:
+# off (default), auto (persisted for whole files only) or on (for entry ranges too)
+entryLists = popOption(sys.argv, "--entry-lists", "off")
+if entryLists not in ENTRY_LIST_MODES:
+    raise ValueError(f"Unknown entry-lists {entryLists}, use off, auto or on")
+# Per-event summary ntuple for re-histogramming (see eventSummary.py), columnar engine only
+summaryPath = popOption(sys.argv, "--summary")
+if summaryPath is not None and engine != "columnar":
+    raise ValueError("--summary needs --engine columnar")
+# Per-file histogram cache (see histCache.py), opt-in: off (default) or on; ignored with
+# --summary, whose rows need every file read
+histCache = popOption(sys.argv, "--hist-cache", "off")
+if histCache not in ["on", "off"]:
+    raise ValueError(f"Unknown hist-cache {histCache}, use on or off")
+if summaryPath is not None:
+    histCache = "off"
 
 # Define lepton type
 lepton = sys.argv[1] # Electron or Muon
@@ -73,27 +111,6 @@ else:  # Electron-specific configurations
     eta_bins = ["eta1", "eta2", "eta3"]
     eta_ranges = [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0)]
 
-# Load lumi masks and apply them
-
-def load_lumi_mask(file_path):
-    with open(file_path, 'r') as f:
-        goldenJSONDict = json.load(f)
-
-    def mask(run, luminosityBlock):
-        mask_array = np.zeros_like(run, dtype=bool)
-        for i in range(len(run)):
-            run_str = str(run[i])
-            if run_str in goldenJSONDict:
-                goodIntervals = goldenJSONDict[run_str]
-                for interval in goodIntervals:
-                    min_lumi, max_lumi = interval
-                    if min_lumi <= luminosityBlock[i] <= max_lumi:
-                        mask_array[i] = True
-                        break
-        return mask_array
-
-    return mask
-
 # Define reference cut function
 
 def passRefCut(ev, era, lumi_mask):
@@ -208,6 +225,15 @@ def get_eta_bin(eta):
             return eta_bins[i]
     return None
 
+# Swap in the C++ helpers (trigEffHelpers.C, compiled once and cached)
+if helpers == "cpp":
+    import cppHelpers
+    cppHelpers.load()
+    passes_lepton_cuts = cppHelpers.passes_lepton_cuts
+    dPhi = cppHelpers.dPhi
+    deltaR = cppHelpers.deltaR
+    is_leading_lepton_matched = cppHelpers.is_leading_lepton_matched
+
 # Load the lumi mask for the specified era
 if data == "data":
     if era == "2016":
@@ -226,14 +252,42 @@ print("Starting %s" % inputFiles)
 inF = 0
 nF = len(inputFiles)
 
-for iFile in inputFiles:
-    inF += 1
-    print(f"Starting file {inF}/{nF}, {iFile}")
-    tf = ROOT.TFile(iFile, "READ")
+selection = {
+    "lepton": lepton, "data": data, "era": era, "etaOption": etaOption,
+    "hlt": hlt, "refhlt": refhlt, "offlineCuts": offlineCuts,
+    "histBins": histBins, "eta_bins": eta_bins, "eta_ranges": eta_ranges,
+    "refMetCut": None,  # passRefCut here has no MET_pt cut
+    "dRVeto": True, "metJetVetoAlways": True, "refInNum": True, "refInDen": data == "data",
+}
+
+# Key of the histogram cache; for data the content of the lumi mask is part of the selection
+cacheHash = configHash({**selection, "lumiMask": lumi_mask_func.fingerprint() if data == "data" else None})
+
+# Column chunks of the selected events for the summary ntuple
+summaryChunks = [] if summaryPath is not None else None
+
+# Only the branches used by the selection are read by the standard loop
+loopBranches = selectionBranches(lepton, hlt, refhlt, era if data == "data" else None)
+
+if engine == "numba":
+    import numbaEff as chunkEngine
+elif engine == "columnar":
+    import columnarEff as chunkEngine
+elif loop == "fast":
+    import fastLoop
+    from refCuts import refCutMaskForFile
+
+def loopFile(path, entryStart=0, entryStop=None):
+    """Standard PyROOT loop over one file (entries entryStart to entryStop), filling histos; returns the cutflow numbers."""
+    tf = ROOT.TFile(path, "READ")
     events = tf.Get("Events")
+    pruneBranches(events, loopBranches)
 
     iEv = 0
-    nEv = events.GetEntries()
+    # Whole file or entry range as given, before the range is resolved
+    persist = persistEntryList(entryLists, entryStart, entryStop)
+    entryStart, entryStop = entryRange(events.GetEntries(), entryStart, entryStop)
+    nEv = entryStop - entryStart
 
     muon_below27 = 0
     electron_below32 = 0
@@ -244,7 +298,13 @@ for iFile in inputFiles:
     lepton_cut_passed = 0
     hlt_path_status = {hltpath: 0 for hltpath in hlt}
 
-    for ev in events:
+    # With entry lists only the events passing the reference cuts are read
+    if data == "data" and entryLists != "off":
+        entries = iterEntryList(events, refEntries(path, era, lumi_mask_func, None, entryStart, entryStop,
+                                                   useCache=persist))
+    else:
+        entries = iterEntries(events, entryStart, entryStop)
+    for ev in entries:
         iEv += 1
         if iEv % 1000 == 0:
             print(f"{iEv}/{nEv} events in file processed")
@@ -265,12 +325,17 @@ for iFile in inputFiles:
         highest_pt_lepton_index = -1
 
         # Find the leading lepton
-        for leptonIndex in range(getattr(ev, "n" + lepton)):
-            if passes_lepton_cuts(ev, lepton, leptonIndex):
-                pt = getattr(ev, lepton + "_pt")[leptonIndex]
-                if pt > highest_pt:
-                    highest_pt = pt
-                    highest_pt_lepton_index = leptonIndex
+        if helpers == "cpp":
+            highest_pt_lepton_index = cppHelpers.leading_lepton_index(ev, lepton)
+            if highest_pt_lepton_index != -1:
+                highest_pt = getattr(ev, lepton + "_pt")[highest_pt_lepton_index]
+        else:
+            for leptonIndex in range(getattr(ev, "n" + lepton)):
+                if passes_lepton_cuts(ev, lepton, leptonIndex):
+                    pt = getattr(ev, lepton + "_pt")[leptonIndex]
+                    if pt > highest_pt:
+                        highest_pt = pt
+                        highest_pt_lepton_index = leptonIndex
 
         if highest_pt_lepton_index == -1:
             continue
@@ -283,11 +348,14 @@ for iFile in inputFiles:
         # Find the leading jet
         highest_jet_pt = -1
         highest_jet_pt_index = -1
-        for jetIndex in range(ev.nJet):
-            if passes_jet_cuts(ev, jetIndex):
-                if ev.Jet_pt[jetIndex] > highest_jet_pt:
-                    highest_jet_pt = ev.Jet_pt[jetIndex]
-                    highest_jet_pt_index = jetIndex
+        if helpers == "cpp":
+            highest_jet_pt_index = cppHelpers.leading_jet_index(ev)
+        else:
+            for jetIndex in range(ev.nJet):
+                if passes_jet_cuts(ev, jetIndex):
+                    if ev.Jet_pt[jetIndex] > highest_jet_pt:
+                        highest_jet_pt = ev.Jet_pt[jetIndex]
+                        highest_jet_pt_index = jetIndex
 
         if highest_jet_pt_index == -1:
             continue
@@ -318,7 +386,7 @@ for iFile in inputFiles:
         # Variables you want to study
 
         passmetCut = ev.MET_pt >= offlineCuts["MET"]
-        passlepCut = getattr(ev, lepton + "_pt")[leptonIndex] >= offlineCuts["lep1pt"]
+        passlepCut = highest_pt >= offlineCuts["lep1pt"]
         dphi = dPhi(lepton_phi, ev.MET_phi)
         mT = np.sqrt(2 * highest_pt * ev.MET_pt * (1 - np.cos(dphi)))
         passmtCut = offlineCuts["mT"][0] < mT < offlineCuts["mT"][1]
@@ -402,12 +470,84 @@ for iFile in inputFiles:
                         if passHLT and lepton_matched and getattr(ev, refhlt, False):
                             histos[var + "_num"].Fill(fillvar)
 
-    print(f"Events remaining after passRefCut: {events_remaining_after_ref_cut}/{nEv}")
-    print(f"Events passing lepton cuts: {lepton_cut_passed}")
-    print(f"Events with leading lepton found: {leading_lepton_found}")
-    print(f"Events with leading jet found: {leading_jet_found}")
-
     tf.Close()
+    return {"nEv": nEv, "ref": events_remaining_after_ref_cut, "lepton": leading_lepton_found,
+            "jet": leading_jet_found, "below": muon_below27 + electron_below32}
+
+def processInputFile(iFile):
+    """Fill histos from one input file (or entry range, see parseInputFile) with the selected engine.
+
+    Returns the cutflow numbers.
+    """
+    path, entryStart, entryStop = parseInputFile(iFile)
+    if engine in ["columnar", "numba"]:
+        counts = emptyCounts(histBins, etaOption, eta_bins)
+        if data == "data" and entryLists != "off":
+            passing = refEntries(path, era, lumi_mask_func, None, entryStart, entryStop,
+                                 useCache=persistEntryList(entryLists, entryStart, entryStop))
+        else:
+            passing = None
+        summaryOption = {"summary": summaryChunks} if summaryChunks is not None else {}
+        stats = chunkEngine.processFile(path, selection, lumi_mask_func if data == "data" else None, counts,
+                                        entryStart=entryStart, entryStop=entryStop, refEntries=passing, **summaryOption)
+        addCountsToHistos(histos, counts)
+        return stats
+    elif loop == "fast":
+        if data == "data":
+            refMaskForFile = refCutMaskCached if persistEntryList(entryLists, entryStart, entryStop) else refCutMaskForFile
+            refMask = refMaskForFile(path, era, lumi_mask_func, metCut=None, entryStart=entryStart, entryStop=entryStop)
+        else:
+            refMask = None
+        return fastLoop.processFile(path, selection, histos, refMask, entryStart, entryStop)
+    else:
+        return loopFile(path, entryStart, entryStop)
+
+def countInputFile(iFile):
+    """processInputFile on reset histograms, returning the histogram contents as arrays and the summary chunks.
+
+    With the histogram cache, unchanged files are not processed again.
+    """
+    if histCache == "on":
+        cached = loadCounts(iFile, cacheHash)
+        if cached is not None:
+            print(f"Histograms of {iFile} from the cache")
+            return iFile, cached[0], cached[1], None
+    for h in histos.values():
+        h.Reset()
+    if summaryChunks is not None:
+        summaryChunks.clear()
+    stats = processInputFile(iFile)
+    counts = histoCounts(histos)
+    if histCache == "on":
+        storeCounts(iFile, cacheHash, counts, stats)
+    return iFile, counts, stats, summaryChunks
+
+def printCutflow(stats):
+    print(f"Events remaining after passRefCut: {stats['ref']}/{stats['nEv']}")
+    print(f"Events passing lepton cuts: {stats['lepton']}")
+    print(f"Events with leading lepton found: {stats['lepton']}")
+    print(f"Events with leading jet found: {stats['jet']}")
+
+if workers > 1 or histCache == "on":
+    # The histograms are reset for every file: the per-file counts are summed here
+    totals = emptyCounts(histBins, etaOption, eta_bins)
+    results = mapFiles(countInputFile, inputFiles, workers) if workers > 1 else map(countInputFile, inputFiles)
+    for iFile, counts, stats, chunks in results:
+        inF += 1
+        print(f"Finished file {inF}/{nF}, {iFile}")
+        printCutflow(stats)
+        for name in totals:
+            totals[name] += counts[name]
+        if chunks is not None:
+            summaryChunks.extend(chunks)
+    for h in histos.values():
+        h.Reset()
+    addCountsToHistos(histos, totals)
+else:
+    for iFile in inputFiles:
+        inF += 1
+        print(f"Starting file {inF}/{nF}, {iFile}")
+        printCutflow(processInputFile(iFile))
 
 for var in histBins:
     if etaOption == "Eta":
@@ -422,3 +562,8 @@ outF = ROOT.TFile(outputHistos, "RECREATE")
 for h in histos:
     histos[h].Write()
 outF.Close()
+
+if summaryPath is not None:
+    from eventSummary import writeSummary
+    nRows = writeSummary(summaryPath, summaryChunks, selection)
+    print(f"Wrote {nRows} selected events to {summaryPath}")
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from provenance import fileStamp
+from trigEffUtils import parseInputFile
+
+# Content-addressed cache of the per-file histogram counts.
+# The count arrays (see trigEffUtils.emptyCounts) and cutflow numbers of every
+# input file (or entry range) are stored as an .npz in CACHE_DIR, keyed by the
+# file's path, size and mtime, the entry range and a hash of the selection
+# configuration. It is opt-in (--hist-cache on in for_data.py and
+# doTriggerEff.py): re-running a script with an unchanged configuration then
+# sums the cached counts and only processes new or changed files. Reading an
+# entry marks it as recently used; once the cache grows past MAX_CACHE_MB the
+# least recently used entries are removed. Files that can't be stat'ed (root://
+# URLs) are not cached.
+
+CACHE_DIR = os.environ.get("TRIGEFF_HISTCACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "trigEffHistos"))
+MAX_CACHE_MB = float(os.environ.get("TRIGEFF_HISTCACHE_MB", "1024"))
+
+
+def cachePath(spec, cfgHash):
+    """Cache file of an input spec for a configuration hash, None when the file can't be stat'ed."""
+    stamp = fileStamp(spec)
+    if stamp is None:
+        return None
+    path, entryStart, entryStop = parseInputFile(spec)
+    identity = [os.path.abspath(path), entryStart, entryStop, stamp, cfgHash]
+    return os.path.join(CACHE_DIR, hashlib.sha1(json.dumps(identity).encode()).hexdigest() + ".npz")
+
+
+def loadCounts(spec, cfgHash):
+    """(counts, cutflow numbers) cached for an input spec, None when not cached."""
+    path = cachePath(spec, cfgHash)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as cached:
+            counts = {name[len("h_"):]: cached[name] for name in cached.files if name.startswith("h_")}
+            stats = json.loads(str(cached["stats"]))
+        os.utime(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return counts, stats
+
+
+def storeCounts(spec, cfgHash, counts, stats, maxMB=MAX_CACHE_MB):
+    """Cache the counts of an input spec, then trim the cache to maxMB; an unwritable cache is not an error."""
+    path = cachePath(spec, cfgHash)
+    if path is None:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp, "wb") as f:
+            np.savez(f, stats=json.dumps(stats), **{"h_" + name: c for name, c in counts.items()})
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    evictCache(maxMB)
+
+
+def evictCache(maxMB=MAX_CACHE_MB):
+    """Remove the least recently used entries until the cache is at most maxMB."""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".npz"):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue  # removed by another process
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= maxMB * 1024 * 1024:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
+        total -= size
@@ -0,0 +1,116 @@
+import glob
+import json
+import os
+import re
+import subprocess
+import numpy as np
+import uproot
+
+from trigEffUtils import histNames
+
+# Checks of the batch job outputs of p3submitJobs.py, for its --resubmit mode.
+# A job fails when its output_{x}.root is missing, cannot be read (e.g.
+# truncated by an interrupted copy), lacks one of the _num/_den histograms
+# written by doTriggerEff.py, has an empty denominator or more numerator than
+# denominator counts, or when its latest batch log shows it did not finish.
+# Run it once the cluster has left the queue: running jobs look failed.
+# Jobs are submitted with condor_submit -spool, so their batch logs stay in the
+# schedd spool until fetched with condor_transfer_data: fetchSpooledLogs does
+# that for the clusters recorded at submission, before the logs are read.
+
+EFF_VARS = ["lep1pt", "MET", "mT", "lep1phi", "MET phi"]
+ETA_BINS = ["eta1", "eta2", "eta3"]
+
+
+def readManifest(path):
+    """(jobId, output name, input files) per line of a manifest written by p3submitJobs.py."""
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                jobs.append((int(fields[0]), fields[1], fields[2:]))
+    return jobs
+
+
+def expectedHistNames(etaOption):
+    return [name for name, var in histNames(dict.fromkeys(EFF_VARS), etaOption, ETA_BINS)]
+
+
+def checkOutput(path, etaOption):
+    """Problems found in one output file, an empty list when it is good."""
+    if not os.path.isfile(path):
+        return ["missing output"]
+    try:
+        with uproot.open(path) as f:
+            keys = set(f.keys(cycle=False))
+            missing = [name for name in expectedHistNames(etaOption) if name not in keys]
+            if missing:
+                return [f"missing histograms {', '.join(missing)}"]
+            counts = {name: f[name].values(flow=True) for name in expectedHistNames(etaOption)}
+    except Exception as e:
+        return [f"unreadable output ({' '.join(str(e).split())})"]
+    problems = []
+    if sum(c.sum() for name, c in counts.items() if name.endswith("_den")) == 0:
+        problems.append("empty denominators")
+    overflowing = [name for name in counts if name.endswith("_num") and np.any(counts[name] > counts[name[:-4] + "_den"])]
+    if overflowing:
+        problems.append(f"numerator above denominator in {', '.join(overflowing)}")
+    return problems
+
+
+def recordCluster(clustersPath, submitOutput):
+    """Append the cluster id printed by condor_submit to clustersPath; returns it, None if not found."""
+    match = re.search(r"submitted to cluster (\d+)", submitOutput)
+    if match is None:
+        return None
+    with open(clustersPath, "a") as f:
+        f.write(match.group(1) + "\n")
+    return match.group(1)
+
+
+def fetchSpooledLogs(clustersPath):
+    """Fetch the spooled batch logs of the clusters in clustersPath; returns the clusters fetched."""
+    if not os.path.isfile(clustersPath):
+        return []
+    with open(clustersPath) as f:
+        clusters = [line.strip() for line in f if line.strip()]
+    fetched = []
+    for cluster in clusters:
+        try:
+            # Fails for clusters already fetched and removed from the queue
+            result = subprocess.run(["condor_transfer_data", cluster], capture_output=True, text=True)
+        except OSError:
+            return fetched  # no condor tools on this machine
+        if result.returncode == 0:
+            fetched.append(cluster)
+    return fetched
+
+
+def checkLogs(logDir, jobId):
+    """Problems in the latest batch logs of a job; no logs is not a problem by itself."""
+    outLogs = sorted(glob.glob(os.path.join(logDir, f"job_{jobId}.*.out")), key=os.path.getmtime)
+    if not outLogs:
+        return []
+    with open(outLogs[-1]) as f:
+        finished = "STOP---------------" in f.read()
+    errLog = outLogs[-1][:-4] + ".err"
+    crashed = False
+    if os.path.isfile(errLog):
+        with open(errLog) as f:
+            crashed = "Traceback" in f.read()
+    problems = []
+    if crashed:
+        problems.append(f"traceback in {errLog}")
+    if not finished:
+        problems.append(f"did not finish according to {outLogs[-1]}")
+    return problems
+
+
+def readProvenance(path):
+    """The provenance record stored in an output file (see provenance.py), None without a readable one."""
+    try:
+        with uproot.open(path) as f:
+            return json.loads(str(f["provenance"]))
+    except Exception:
+        return None
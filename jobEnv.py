@@ -0,0 +1,66 @@
+import os
+
+# Environment setup of the batch jobs written by p3submitJobs.py.
+#   cmsrel   set up a fresh release in every job (slow: minutes of CVMFS traffic)
+#   shared   activate one prebuilt release area seen by all jobs (e.g. on AFS),
+#            made once with cmsrel
+#   tarball  unpack a packed release once per worker node into a local cache
+#            shared by the jobs of that node, then only activate it; pack it with
+#            tar -czf CMSSW_13_3_3.tar.gz CMSSW_13_3_3
+#            The cache is a fixed node-wide path (not $TMPDIR, which HTCondor
+#            points at each job's own scratch); when it isn't writable the job
+#            unpacks into its scratch instead.
+#   none     keep the environment the job starts in (e.g. local runs, see localExecutor.py)
+ENV_MODES = ["cmsrel", "shared", "tarball", "none"]
+
+CACHE_DIR = "/tmp/trigeff_env_$(id -u)"
+
+
+def checkEnvironment(envMode, sharedArea, tarball):
+    """Fail at submission rather than in every job when the environment is missing."""
+    if envMode not in ENV_MODES:
+        raise ValueError(f"Unknown envMode {envMode}, use one of {', '.join(ENV_MODES)}")
+    if envMode == "shared" and not os.path.isdir(os.path.join(sharedArea, "src")):
+        raise FileNotFoundError(f"No release area at {sharedArea}, create it once with cmsrel")
+    if envMode == "tarball" and not os.path.isfile(tarball):
+        raise FileNotFoundError(f"No release tarball at {tarball}")
+
+
+def setupLines(envMode, release, sharedArea, tarball, cacheDir=CACHE_DIR):
+    """Shell lines that activate the job environment; cacheDir is the node-wide unpack cache of envMode tarball."""
+    if envMode == "none":
+        return []
+    lines = ["source /cvmfs/cms.cern.ch/cmsset_default.sh"]
+    if envMode == "cmsrel":
+        lines += [
+            f"cmsrel {release}",
+            f"cd {release}/src",
+            "cmsenv",
+            "cd -",
+        ]
+    elif envMode == "shared":
+        lines += [
+            f"cd {sharedArea}/src",
+            "eval `scramv1 runtime -sh`",
+            "cd -",
+        ]
+    else:
+        # The first job on a node unpacks under a lock, the others wait and reuse it
+        lines += [
+            f"ENVDIR={cacheDir}",
+            "mkdir -p $ENVDIR 2>/dev/null && [ -w $ENVDIR ] || ENVDIR=$PWD/trigeff_env",
+            "mkdir -p $ENVDIR",
+            "(",
+            "  flock 9",
+            f"  if [ ! -e $ENVDIR/{release}.ready ]; then",
+            f"    rm -rf $ENVDIR/{release}",
+            f"    tar -xzf {tarball} -C $ENVDIR",
+            f"    (cd $ENVDIR/{release}/src && scram b ProjectRename)",
+            f"    touch $ENVDIR/{release}.ready",
+            "  fi",
+            ") 9>$ENVDIR/.lock",
+            f"cd $ENVDIR/{release}/src",
+            "eval `scramv1 runtime -sh`",
+            "cd -",
+        ]
+    return lines
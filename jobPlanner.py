@@ -0,0 +1,148 @@
+import heapq
+import math
+import uproot
+
+from trigEffUtils import inputFileSpec, parseInputFile
+
+# Job planning for p3submitJobs.py.
+# Every input file becomes one or more work units (whole file, or cluster-aligned
+# entry ranges of the large ones), and the units are spread over jobs so that
+# each job's total entries or compressed bytes fit a target wall time of the
+# chosen HTCondor queue flavour.
+
+# Maximum wall time of the CERN HTCondor job flavours, in seconds
+QUEUE_WALL_TIME = {
+    "espresso": 20 * 60,
+    "microcentury": 60 * 60,
+    "longlunch": 2 * 60 * 60,
+    "workday": 8 * 60 * 60,
+    "tomorrow": 24 * 60 * 60,
+    "testmatch": 3 * 24 * 60 * 60,
+    "nextweek": 7 * 24 * 60 * 60,
+}
+
+
+def targetCost(queue, balanceBy, eventsPerSecond, bytesPerSecond, wallTimeFraction):
+    """Entries or compressed bytes one job can process in wallTimeFraction of the queue's wall time."""
+    seconds = QUEUE_WALL_TIME[queue] * wallTimeFraction
+    if balanceBy == "entries":
+        return seconds * eventsPerSecond
+    elif balanceBy == "bytes":
+        return seconds * bytesPerSecond
+    raise ValueError(f"Unknown balanceBy {balanceBy}, use entries or bytes")
+
+
+def clusterRanges(boundaries, maxEntries):
+    """Entry ranges (start, stop) of at most maxEntries, cut at the given cluster boundaries.
+
+    A single cluster larger than maxEntries stays one range.
+    """
+    ranges = []
+    start = last = 0
+    for boundary in boundaries[1:]:
+        if boundary - start > maxEntries and last > start:
+            ranges.append((start, last))
+            start = last
+        last = boundary
+    ranges.append((start, last))
+    return ranges
+
+
+def fileUnits(path, maxCost, balanceBy, splitFiles=True):
+    """Work units of one file: dicts with the input spec, entries and compressed bytes.
+
+    Files costing more than maxCost are split into cluster-aligned entry ranges
+    unless splitFiles is False (engines reading whole files only, like rdf);
+    bytes of a range are estimated from the file's average bytes per entry.
+    """
+    with uproot.open(path) as f:
+        tree = f["Events"]
+        nEntries = tree.num_entries
+        if nEntries == 0:
+            return []
+        nBytes = tree.compressed_bytes
+        bytesPerEntry = nBytes / nEntries
+        maxEntries = maxCost if balanceBy == "entries" else maxCost / bytesPerEntry
+        if nEntries <= maxEntries or not splitFiles:
+            return [{"spec": path, "entries": nEntries, "bytes": nBytes}]
+        boundaries = tree.common_entry_offsets()
+    return [{"spec": inputFileSpec(path, start, stop), "entries": stop - start, "bytes": (stop - start) * bytesPerEntry}
+            for start, stop in clusterRanges(boundaries, max(int(maxEntries), 1))]
+
+
+def splitUnit(unit, maxEntries):
+    """Split a work unit (file or entry range) into cluster-aligned ranges of at most maxEntries."""
+    if unit["entries"] <= maxEntries:
+        return [unit]
+    path, entryStart, entryStop = parseInputFile(unit["spec"])
+    entryStop = entryStart + unit["entries"]
+    with uproot.open(path) as f:
+        offsets = f["Events"].common_entry_offsets()
+    boundaries = [entryStart] + [b for b in offsets if entryStart < b < entryStop] + [entryStop]
+    bytesPerEntry = unit["bytes"] / unit["entries"]
+    return [dict(unit, spec=inputFileSpec(path, entryStart + start, entryStart + stop), entries=stop - start,
+                 bytes=(stop - start) * bytesPerEntry)
+            for start, stop in clusterRanges([b - entryStart for b in boundaries], max(int(maxEntries), 1))]
+
+
+def assignUnits(units, nJobs, balanceBy):
+    """Longest units first, each onto the currently lightest job."""
+    jobs = [[] for _ in range(nJobs)]
+    loads = [(0, i) for i in range(nJobs)]
+    for unit in sorted(units, key=lambda u: u[balanceBy], reverse=True):
+        load, i = heapq.heappop(loads)
+        jobs[i].append(unit)
+        heapq.heappush(loads, (load + unit[balanceBy], i))
+    return jobs
+
+
+def planJobs(units, maxCost, balanceBy):
+    """Spread the units over the fewest jobs that keep every job within maxCost.
+
+    Units larger than maxCost (single clusters) get a job of their own. Jobs
+    never come out empty, and keep their units in input order.
+    """
+    if not units:
+        return []
+    order = {id(unit): i for i, unit in enumerate(units)}
+    total = sum(unit[balanceBy] for unit in units)
+    nJobs = min(max(1, math.ceil(total / maxCost)), len(units))
+    while True:
+        jobs = assignUnits(units, nJobs, balanceBy)
+        fits = all(sum(u[balanceBy] for u in job) <= maxCost or len(job) == 1 for job in jobs)
+        if fits or nJobs == len(units):
+            break
+        nJobs += 1
+    return [sorted(job, key=lambda u: order[id(u)]) for job in jobs if job]
+
+
+def formatDuration(seconds):
+    minutes = int(round(seconds / 60))
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def printPlan(jobs, queue, balanceBy, eventsPerSecond, bytesPerSecond):
+    """Print the planned jobs and the spread of their sizes and estimated run times.
+
+    Units with a predicted "seconds" (and "memoryMB") from the cost model use
+    those instead of the fixed rates.
+    """
+    def seconds(job):
+        if all("seconds" in u for u in job):
+            return sum(u["seconds"] for u in job)
+        if balanceBy == "entries":
+            return sum(u["entries"] for u in job) / eventsPerSecond
+        return sum(u["bytes"] for u in job) / bytesPerSecond
+
+    print(f"Planned {len(jobs)} jobs on {queue} (max wall time {formatDuration(QUEUE_WALL_TIME[queue])}), "
+          f"balanced by {balanceBy}")
+    for x, job in enumerate(jobs, start=1):
+        memory = [u["memoryMB"] for u in job if u.get("memoryMB") is not None]
+        print(f"  job {x}: {len(job)} inputs, {sum(u['entries'] for u in job)} entries, "
+              f"{sum(u['bytes'] for u in job) / 1e6:.1f} MB, ~{formatDuration(seconds(job))}"
+              + (f", ~{max(memory):.0f} MB memory" if memory else "")
+              + (" OVER WALL TIME" if seconds(job) > QUEUE_WALL_TIME[queue] else ""))
+    if jobs:
+        times = sorted(seconds(job) for job in jobs)
+        print(f"Estimated time per job: min {formatDuration(times[0])}, "
+              f"median {formatDuration(times[len(times) // 2])}, max {formatDuration(times[-1])}")
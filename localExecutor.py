@@ -0,0 +1,37 @@
+import os
+import subprocess
+import time
+from multiprocessing.pool import ThreadPool
+
+from jobCheck import readManifest
+
+# Local backend of p3submitJobs.py: runs the jobs of a manifest with the same
+# executable the HTCondor jobs use, at most nWorkers at a time. Each job runs in
+# its own directory tmp{tag}/job_{x} and its stdout/stderr go to
+# batchlogs{tag}/job_{x}.local.{n}.out/.err, named like the condor logs so
+# the --resubmit checks read them the same way.
+
+
+def runJob(args):
+    x, outputName, jobFiles, executable, jobDir, logBase = args
+    os.makedirs(jobDir, exist_ok=True)
+    start = time.time()
+    with open(logBase + ".out", "w") as out, open(logBase + ".err", "w") as err:
+        returncode = subprocess.call([executable, outputName] + jobFiles, cwd=jobDir, stdout=out, stderr=err)
+    return x, returncode, time.time() - start
+
+
+def runLocal(manifest, executable, workDir, logDir, nWorkers):
+    """Run every job of the manifest locally; returns the numbers of the jobs that exited with an error."""
+    # Runs of this log directory so far, so resubmissions don't overwrite earlier logs
+    nRun = len({name.split(".")[2] for name in os.listdir(logDir) if ".local." in name})
+    tasks = [(x, outputName, jobFiles, os.path.abspath(executable), os.path.join(workDir, f"job_{x}"),
+              os.path.join(logDir, f"job_{x}.local.{nRun}"))
+             for x, outputName, jobFiles in readManifest(manifest)]
+    failed = []
+    with ThreadPool(nWorkers) as pool:
+        for x, returncode, seconds in pool.imap_unordered(runJob, tasks):
+            print(f"job {x} finished in {seconds:.0f} s with exit code {returncode}")
+            if returncode != 0:
+                failed.append(x)
+    return sorted(failed)
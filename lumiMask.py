@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Golden-JSON lumi mask compiled into sorted interval arrays.
+# Each good (run, lumi range) becomes a pair of uint64 keys run << 32 | lumi,
+# so a whole run/luminosityBlock array is answered with one searchsorted call.
+# The compiled arrays are cached next to the JSON as <json>.<sha1>.npz so batch
+# jobs don't each parse the full certification file.
+
+
+class LumiMask:
+    def __init__(self, runs, starts, ends):
+        order = np.lexsort((starts, runs))
+        self.runs = np.asarray(runs, dtype=np.uint64)[order]
+        self.starts = np.asarray(starts, dtype=np.uint64)[order]
+        self.ends = np.asarray(ends, dtype=np.uint64)[order]
+        self._lo = (self.runs << np.uint64(32)) | self.starts
+        self._hi = (self.runs << np.uint64(32)) | self.ends
+
+    def __call__(self, run, luminosityBlock):
+        """Boolean array, True where (run, luminosityBlock) is in a good interval."""
+        key = (np.asarray(run, dtype=np.uint64) << np.uint64(32)) | np.asarray(luminosityBlock, dtype=np.uint64)
+        idx = np.searchsorted(self._lo, key, side="right") - 1
+        inside = idx >= 0
+        inside[inside] = key[inside] <= self._hi[idx[inside]]
+        return inside
+
+    def fingerprint(self):
+        """Hash of the good intervals, identifying the mask whatever JSON file it came from."""
+        return hashlib.sha1(self._lo.tobytes() + self._hi.tobytes()).hexdigest()
+
+    def save(self, path):
+        """Write the compiled arrays atomically; an unwritable location is not an error."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, runs=self.runs, starts=self.starts, ends=self.ends)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def fromJSON(cls, file_path, useCache=True):
+        with open(file_path, "rb") as f:
+            raw = f.read()
+        cachePath = f"{file_path}.{hashlib.sha1(raw).hexdigest()[:16]}.npz"
+
+        if useCache and os.path.exists(cachePath):
+            try:
+                with np.load(cachePath) as cached:
+                    return cls(cached["runs"], cached["starts"], cached["ends"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        goldenJSONDict = json.loads(raw)
+        runs, starts, ends = [], [], []
+        for run, goodIntervals in goldenJSONDict.items():
+            for min_lumi, max_lumi in goodIntervals:
+                runs.append(int(run))
+                starts.append(min_lumi)
+                ends.append(max_lumi)
+        mask = cls(np.array(runs, dtype=np.uint64), np.array(starts, dtype=np.uint64), np.array(ends, dtype=np.uint64))
+        if useCache:
+            mask.save(cachePath)
+        return mask
+
+
+def load_lumi_mask(file_path):
+    return LumiMask.fromJSON(file_path)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import multiprocessing
+import os
+import sys
+import numpy as np
+import uproot
+
+from trigEffUtils import popOption
+
+# Merge the per-job output_{x}.root files of p3submitJobs.py, replacing hadd.
+# Usage: python3 mergeOutputs.py merged.root output_*.root [--workers N]
+# The inputs are split into one group per worker; each worker streams its
+# group, holding one running sum and one input file at a time, and the partial
+# sums are then added pairwise in a tree reduction. Every histogram must have
+# the same bin edges in every input, which is checked before summing.
+
+# Summed TH1 statistics, besides the bin contents and sumw2
+STAT_MEMBERS = ["fEntries", "fTsumw", "fTsumw2", "fTsumwx", "fTsumwx2"]
+
+
+def readHistos(path):
+    """Contents of every TH1 of a file: bin contents with flow, sumw2, summed stats and axis."""
+    histos = {}
+    with uproot.open(path) as f:
+        for name, cls in f.classnames(cycle=False).items():
+            if not cls.startswith("TH1"):
+                continue
+            h = f[name]
+            values = h.values(flow=True).astype(np.float64)
+            sumw2 = np.asarray(h.member("fSumw2"), dtype=np.float64)
+            axis = h.member("fXaxis")
+            histos[name] = {
+                "cls": cls,
+                "title": h.member("fTitle"),
+                "values": values,
+                "sumw2": sumw2 if len(sumw2) == len(values) else values.copy(),
+                "stats": np.array([h.member(m) for m in STAT_MEMBERS], dtype=np.float64),
+                "edges": h.axis().edges(),
+                "axis": (axis.member("fNbins"), axis.member("fXmin"), axis.member("fXmax"),
+                         np.asarray(axis.member("fXbins"), dtype=np.float64)),
+            }
+    return histos
+
+
+def addHistos(total, histos, source):
+    """Add histos onto total in place, after checking names and bin edges."""
+    if total.keys() != histos.keys():
+        raise ValueError(f"{source}: histograms {sorted(total.keys() ^ histos.keys())} are not in every input")
+    for name, h in histos.items():
+        if not np.array_equal(total[name]["edges"], h["edges"]):
+            raise ValueError(f"{source}: bin edges of {name} differ from the other inputs")
+    for name, h in histos.items():
+        total[name]["values"] += h["values"]
+        total[name]["sumw2"] += h["sumw2"]
+        total[name]["stats"] += h["stats"]
+    return total
+
+
+def sumFiles(paths):
+    total = readHistos(paths[0])
+    for path in paths[1:]:
+        addHistos(total, readHistos(path), path)
+    return total
+
+
+def sumPair(pair):
+    if len(pair) == 1:
+        return pair[0]
+    return addHistos(pair[0], pair[1], "partial sums")
+
+
+def mergeFiles(paths, nWorkers):
+    """Sum the histograms of all paths, in parallel over nWorkers processes."""
+    nGroups = max(1, min(nWorkers, len(paths)))
+    groups = [paths[i::nGroups] for i in range(nGroups)]
+    with multiprocessing.get_context("fork").Pool(nGroups) as pool:
+        partials = pool.map(sumFiles, groups)
+        while len(partials) > 1:
+            partials = pool.map(sumPair, [partials[i:i + 2] for i in range(0, len(partials), 2)])
+    return partials[0]
+
+
+def writeHistos(path, histos):
+    with uproot.recreate(path) as f:
+        for name, h in histos.items():
+            nbins, low, high, xbins = h["axis"]
+            dtype = np.float64 if h["cls"] == "TH1D" else np.float32
+            f[name] = uproot.writing.identify.to_TH1x(
+                name, h["title"], h["values"].astype(dtype), *h["stats"], h["sumw2"],
+                uproot.writing.identify.to_TAxis("xaxis", "", nbins, low, high, xbins))
+
+
+if __name__ == "__main__":
+    nWorkers = int(popOption(sys.argv, "--workers", str(os.cpu_count())))
+    outputFile = sys.argv[1]
+    inputFiles = sys.argv[2:]
+    if not inputFiles:
+        raise ValueError("Usage: python3 mergeOutputs.py merged.root output_*.root [--workers N]")
+    merged = mergeFiles(inputFiles, nWorkers)
+    writeHistos(outputFile, merged)
+    print(f"Merged {len(merged)} histograms of {len(inputFiles)} files into {outputFile}")
@@ -0,0 +1,273 @@
+import numpy as np
+import awkward as ak
+import uproot
+from numba import njit
+
+from trigEffUtils import nBins, entryRange
+from refCuts import refCutMask
+from columnarEff import STEP_SIZE, neededBranches, triggerBit, survivorRanges, clusterBoundaries
+
+# Numba engine for the for_data.py selection.
+# The per-event logic (leading tight lepton, leading jet above 60 GeV, dR/dPhi
+# vetoes, trigger matching, offline cuts) runs as one jitted kernel over the
+# offsets and content buffers of a chunk, filling num/den count arrays directly.
+
+VAR_CODES = {"lep1pt": 0, "MET": 1, "mT": 2, "lep1phi": 3, "MET phi": 4}
+
+
+def jagged(array):
+    """(offsets, content) buffers of a jagged array of numbers."""
+    layout = ak.to_layout(array)
+    if not isinstance(layout, ak.contents.ListOffsetArray):
+        layout = layout.to_ListOffsetArray64(False)
+    return np.asarray(layout.offsets), np.asarray(layout.content.data)
+
+
+@njit(cache=True)
+def _dPhi(obj_phi, jet_phi):
+    return np.arccos(np.cos(obj_phi - jet_phi))
+
+
+@njit(cache=True)
+def _deltaR(eta1, phi1, eta2, phi2):
+    deta = eta1 - eta2
+    dphi = phi1 - phi2
+    dphi = np.arctan2(np.sin(dphi), np.cos(dphi))
+    return np.sqrt(deta**2 + dphi**2)
+
+
+@njit(cache=True)
+def _passesLeptonCuts(isElectron, j, eta, dz, dxy, idA, idB):
+    # Muon: idA = tightId, idB = pfIsoId; Electron: idA = cutBased, idB = mvaFall17V2Iso_WP80
+    absEta = abs(np.float64(eta[j]))
+    if not isElectron:
+        return (idA[j] != 0 and absEta < 2.4 and abs(np.float64(dz[j])) <= 0.05
+                and abs(np.float64(dxy[j])) <= 0.02 and idB[j] >= 5)
+    wide = 1.0 if absEta > 1.479 else 0.0
+    return (idA[j] >= 2 and idB[j] != 0
+            and abs(np.float64(dxy[j])) < 0.05 + 0.05 * wide
+            and abs(np.float64(dz[j])) < 0.10 + 0.10 * wide
+            and (absEta < 1.444 or absEta > 1.566)
+            and absEta < 2.5)
+
+
+@njit(cache=True)
+def _binIndex(x, isEdges, edges, nEdges, nbins, low, high):
+    if isEdges:
+        return np.searchsorted(edges[:nEdges], x, side="right")
+    if x < low:
+        return 0
+    if not (x < high):
+        return nbins + 1
+    return int(nbins * (x - low) / (high - low)) + 1
+
+
+@njit(cache=True)
+def eventKernel(refMask, passHLT, passRef, metPt, metPhi,
+                lepOffsets, lepPt, lepEta, lepPhi, lepDz, lepDxy, lepIdA, lepIdB, isElectron,
+                jetOffsets, jetPt, jetEta, jetPhi,
+                trigOffsets, trigEta, trigPhi, trigId, trigBits,
+                isData, cutLep, cutMET, mtLow, mtHigh, etaLow, etaHigh, useEta,
+                varCodes, isEdges, edges, nEdges, nbinsArr, lows, highs, num, den, stats):
+    nVars = len(varCodes)
+    for i in range(len(refMask)):
+        if not refMask[i]:
+            continue
+        stats[0] += 1
+
+        # Leading lepton passing the lepton cuts
+        highest_pt = -1.0
+        lepIdx = -1
+        for j in range(lepOffsets[i], lepOffsets[i + 1]):
+            if _passesLeptonCuts(isElectron, j, lepEta, lepDz, lepDxy, lepIdA, lepIdB):
+                if lepPt[j] > highest_pt:
+                    highest_pt = np.float64(lepPt[j])
+                    lepIdx = j
+        if lepIdx == -1:
+            continue
+        stats[1] += 1
+
+        # Leading jet above 60 GeV
+        highest_jet_pt = -1.0
+        jetIdx = -1
+        for j in range(jetOffsets[i], jetOffsets[i + 1]):
+            if jetPt[j] > 60 and jetPt[j] > highest_jet_pt:
+                highest_jet_pt = np.float64(jetPt[j])
+                jetIdx = j
+        if jetIdx == -1:
+            continue
+        stats[2] += 1
+
+        lepton_eta = np.float64(lepEta[lepIdx])
+        lepton_phi = np.float64(lepPhi[lepIdx])
+        jet_eta = np.float64(jetEta[jetIdx])
+        jet_phi = np.float64(jetPhi[jetIdx])
+        met = np.float64(metPt[i])
+        met_phi = np.float64(metPhi[i])
+
+        if _deltaR(lepton_eta, lepton_phi, jet_eta, jet_phi) < 0.5:
+            continue
+        if _dPhi(lepton_phi, jet_phi) < 1.5:
+            continue
+        if _dPhi(met_phi, jet_phi) < 1.5:
+            continue
+
+        # Match the leading lepton to trigger objects
+        matched = False
+        for k in range(trigOffsets[i], trigOffsets[i + 1]):
+            bits = trigBits[k]
+            if isElectron:
+                good = abs(trigId[k]) == 11 and ((bits & 2) == 2 or (bits & 2048) == 2048 or (bits & 8192) == 8192)
+            else:
+                good = abs(trigId[k]) == 13 and (((bits & 2) == 2 and (bits & 8) == 8) or (bits & 1024) == 1024)
+            if good and _deltaR(lepton_eta, lepton_phi, np.float64(trigEta[k]), np.float64(trigPhi[k])) < 0.1:
+                matched = True
+                break
+
+        passmetCut = met >= cutMET
+        passlepCut = highest_pt >= cutLep
+        mT = np.sqrt(2 * highest_pt * met * (1 - np.cos(_dPhi(lepton_phi, met_phi))))
+        passmtCut = mtLow < mT < mtHigh
+
+        etaBin = 0
+        if useEta:
+            etaBin = -1
+            for b in range(len(etaLow)):
+                if etaLow[b] <= abs(lepton_eta) < etaHigh[b]:
+                    etaBin = b
+                    break
+            if etaBin == -1:
+                continue
+
+        for v in range(nVars):
+            code = varCodes[v]
+            if code == 0:
+                passDen = passmetCut and passmtCut
+                fillvar = highest_pt
+            elif code == 1:
+                passDen = passlepCut and passmtCut
+                fillvar = met
+            elif code == 2:
+                passDen = passlepCut and passmetCut
+                fillvar = mT
+            elif code == 3:
+                passDen = passmetCut and passmtCut and passlepCut
+                fillvar = lepton_phi
+            else:
+                passDen = passmetCut and passmtCut and passlepCut
+                fillvar = met_phi
+            if isData:
+                passDen = passDen and passRef[i]
+            if passDen:
+                b = _binIndex(fillvar, isEdges[v], edges[v], nEdges[v], nbinsArr[v], lows[v], highs[v])
+                den[etaBin, v, b] += 1
+                if passHLT[i] and matched and passRef[i]:
+                    num[etaBin, v, b] += 1
+
+
+class Binning:
+    """histBins flattened into arrays the kernel can use."""
+
+    def __init__(self, histBins):
+        self.vars = list(histBins)
+        nVars = len(self.vars)
+        maxEdges = max(len(histBins[var]) if var == "lep1pt" else 2 for var in self.vars)
+        self.varCodes = np.array([VAR_CODES[var] for var in self.vars], dtype=np.int64)
+        self.isEdges = np.array([var == "lep1pt" for var in self.vars])
+        self.edges = np.zeros((nVars, maxEdges))
+        self.nEdges = np.zeros(nVars, dtype=np.int64)
+        self.nbins = np.zeros(nVars, dtype=np.int64)
+        self.lows = np.zeros(nVars)
+        self.highs = np.zeros(nVars)
+        for v, var in enumerate(self.vars):
+            binning = histBins[var]
+            self.nbins[v] = nBins(var, binning)
+            if var == "lep1pt":
+                self.edges[v, :len(binning)] = binning
+                self.nEdges[v] = len(binning)
+            else:
+                self.lows[v], self.highs[v] = binning[1], binning[2]
+        self.maxBins = int(self.nbins.max()) + 2
+
+
+def processChunk(arrays, cfg, lumi_mask, binning, num, den, stats):
+    lepton = cfg["lepton"]
+    isData = cfg["data"] == "data"
+    isElectron = lepton == "Electron"
+    offlineCuts = cfg["offlineCuts"]
+
+    if isData:
+        refMask = refCutMask(arrays, cfg["era"], lumi_mask, cfg["refMetCut"])
+    else:
+        refMask = np.ones(len(arrays), dtype=bool)
+    passHLT = np.zeros(len(arrays), dtype=bool)
+    for hltpath in cfg["hlt"]:
+        passHLT |= triggerBit(arrays, hltpath)
+    passRef = triggerBit(arrays, cfg["refhlt"])
+
+    lepOffsets, lepPt = jagged(arrays[lepton + "_pt"])
+    _, lepEta = jagged(arrays[lepton + "_eta"])
+    _, lepPhi = jagged(arrays[lepton + "_phi"])
+    _, lepDz = jagged(arrays[lepton + "_dz"])
+    _, lepDxy = jagged(arrays[lepton + "_dxy"])
+    if isElectron:
+        _, lepIdA = jagged(arrays["Electron_cutBased"])
+        _, lepIdB = jagged(arrays["Electron_mvaFall17V2Iso_WP80"])
+    else:
+        _, lepIdA = jagged(arrays["Muon_tightId"])
+        _, lepIdB = jagged(arrays["Muon_pfIsoId"])
+    jetOffsets, jetPt = jagged(arrays["Jet_pt"])
+    _, jetEta = jagged(arrays["Jet_eta"])
+    _, jetPhi = jagged(arrays["Jet_phi"])
+    trigOffsets, trigEta = jagged(arrays["TrigObj_eta"])
+    _, trigPhi = jagged(arrays["TrigObj_phi"])
+    _, trigId = jagged(arrays["TrigObj_id"])
+    _, trigBits = jagged(arrays["TrigObj_filterBits"])
+
+    eta_ranges = cfg["eta_ranges"]
+    eventKernel(refMask, passHLT, passRef,
+                ak.to_numpy(arrays["MET_pt"]), ak.to_numpy(arrays["MET_phi"]),
+                lepOffsets, lepPt, lepEta, lepPhi, lepDz, lepDxy,
+                lepIdA.astype(np.int64), lepIdB.astype(np.int64), isElectron,
+                jetOffsets, jetPt, jetEta, jetPhi,
+                trigOffsets, trigEta, trigPhi, trigId, trigBits,
+                isData, float(offlineCuts["lep1pt"]), float(offlineCuts["MET"]),
+                float(offlineCuts["mT"][0]), float(offlineCuts["mT"][1]),
+                np.array([low for low, high in eta_ranges], dtype=np.float64),
+                np.array([high for low, high in eta_ranges], dtype=np.float64),
+                cfg["etaOption"] == "Eta",
+                binning.varCodes, binning.isEdges, binning.edges, binning.nEdges,
+                binning.nbins, binning.lows, binning.highs, num, den, stats)
+
+
+def processFile(path, cfg, lumi_mask, counts, stepSize=STEP_SIZE, entryStart=0, entryStop=None, refEntries=None):
+    """Same interface as columnarEff.processFile."""
+    binning = Binning(cfg["histBins"])
+    prefixes = [eta_bin + "_" for eta_bin in cfg["eta_bins"]] if cfg["etaOption"] == "Eta" else [""]
+    num = np.zeros((len(prefixes), len(binning.vars), binning.maxBins))
+    den = np.zeros_like(num)
+    cutflow = np.zeros(3, dtype=np.int64)
+
+    with uproot.open(path) as f:
+        tree = f["Events"]
+        entryStart, entryStop = entryRange(tree.num_entries, entryStart, entryStop)
+        nEv = entryStop - entryStart
+        branches = neededBranches(cfg, set(tree.keys()))
+        if refEntries is None:
+            ranges = [(0, nEv)]
+        else:
+            # Only the clusters holding reference-passing events
+            refMask = np.zeros(nEv, dtype=bool)
+            refMask[np.asarray(refEntries, dtype=np.int64) - entryStart] = True
+            ranges = survivorRanges(refMask, clusterBoundaries(tree, branches, entryStart, entryStop), stepSize)
+        for start, stop in ranges:
+            for arrays in tree.iterate(branches, step_size=stepSize, entry_start=entryStart + start,
+                                       entry_stop=entryStart + stop, library="ak"):
+                processChunk(arrays, cfg, lumi_mask, binning, num, den, cutflow)
+
+    for e, prefix in enumerate(prefixes):
+        for v, var in enumerate(binning.vars):
+            size = binning.nbins[v] + 2
+            counts[f"{prefix}{var}_num"] += num[e, v, :size]
+            counts[f"{prefix}{var}_den"] += den[e, v, :size]
+    return {"nEv": nEv, "ref": int(cutflow[0]), "lepton": int(cutflow[1]), "jet": int(cutflow[2])}
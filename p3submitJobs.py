@@ -1,16 +1,50 @@
 #!/usr/bin/env python3
 import os
+import glob
 import re
 import math
 import time
 import sys
+import shutil
+import subprocess
+import itertools
+from jobPlanner import QUEUE_WALL_TIME, targetCost, fileUnits, splitUnit, planJobs, printPlan
+from costModel import CostModel, harvestTelemetry, readHistory, optionsEngineKey, predictUnits
+from jobEnv import checkEnvironment, setupLines
+from jobCheck import readManifest, checkOutput, checkLogs, readProvenance, recordCluster, fetchSpooledLogs
+from provenance import matchesProvenance
+from localExecutor import runLocal
+from trigEffUtils import popOption
 print()
 print('START')
 print()
 ########   YOU ONLY NEED TO FILL THE AREA BELOW   #########
 ########   customization area #########
-interval = 5  # number files to be processed in a single job, take care to split your file so that you run on all files. The last job might be with smaller number of files (the ones that remain).
-queue = "longlunch"
+queue = "longlunch"  # espresso (20 min), microcentury (1 h), longlunch (2 h), workday (8 h), ...
+balanceBy = "entries"  # balance the jobs by "entries" or compressed "bytes" of their inputs
+eventsPerSecond = 1000  # processing rate assumed when balancing by entries
+bytesPerSecond = 1.5e6  # processing rate assumed when balancing by bytes
+wallTimeFraction = 0.5  # target this fraction of the queue's wall time per job, leaving headroom for slow nodes
+telemetryHistory = "jobTelemetry.jsonl"  # telemetry of past jobs, for the cost model that checks the plan (see costModel.py)
+jobOptions = ""  # extra doTriggerEff.py options of the jobs, e.g. "--loop fast"
+envMode = "cmsrel"  # job environment: "cmsrel" in every job, or opt in to a "shared" release area, a "tarball" unpacked once per node, or "none" to keep the current one
+cmsswRelease = "CMSSW_13_3_3"
+sharedArea = f"/afs/cern.ch/user/b/bmay/{cmsswRelease}"  # prebuilt once with cmsrel, used by envMode = "shared"
+envTarball = f"/eos/home-z/zdemirag/forWH/{cmsswRelease}.tar.gz"  # packed release, used by envMode = "tarball"
+envCacheDir = "/tmp/trigeff_env_$(id -u)"  # node-wide directory the tarball is unpacked into, shared by the jobs of a node
+outputDir = "/afs/cern.ch/user/b/bmay"  # the jobs copy their output_{x}.root here
+scriptDir = "/eos/home-z/zdemirag/forWH"  # where the jobs find doTriggerEff.py
+# --backend local: run the jobs on this machine, --local-workers at a time, instead of submitting them to condor
+backend = popOption(sys.argv, "--backend", "condor")
+localWorkers = int(popOption(sys.argv, "--local-workers", str(os.cpu_count())))
+# --dry-run: only print the planned jobs and their predicted run time and memory
+dryRun = "--dry-run" in sys.argv
+if dryRun:
+    sys.argv.remove("--dry-run")
+# --resubmit: check the outputs and logs of the last submission and resubmit only the failed jobs
+resubmit = "--resubmit" in sys.argv
+if resubmit:
+    sys.argv.remove("--resubmit")
 tag = str(sys.argv[1]) #Muon or Electron
 NumberOfJobs = -1
 doSubmit = True
@@ -22,64 +56,161 @@ files = []
 
 for fil in os.listdir(mainfolder):
     if "root" in fil:
-        files.append(os.path.join(mainfolder, fil))
+        files.append(os.path.join(os.path.abspath(mainfolder), fil))
 
 ########   customization end   #########
-path = os.getcwd()
-print()
-print('do not worry about folder creation:')
-os.system(f"rm -rf tmp{tag}")
-os.system(f"rm -rf exec{tag}")
-os.system(f"rm -rf batchlogs{tag}")
-os.system(f"mkdir -p tmp{tag}")
-os.system(f"mkdir -p exec{tag}")
-print()
 
-if NumberOfJobs == -1:
-    NumberOfJobs = (len(files) + interval) // interval
-##### loop for creating and sending jobs #####
-for x in range(1, int(NumberOfJobs) + 1):
-    ##### creates directory and file list for job #######
-    jobFiles = files[max(0, (x - 1) * interval):min(x * interval, len(files))]
-    with open(f'exec{tag}/job_{x}.sh', 'w') as fout:
-        fout.write("#!/bin/sh\n")
-        fout.write("echo\n")
-        fout.write("echo\n")
-        fout.write("echo 'START---------------'\n")
-        fout.write("echo 'WORKDIR ' ${PWD}\n")
-        fout.write("export HOME=$PWD\n")
-        fout.write("source /cvmfs/cms.cern.ch/cmsset_default.sh\n")
-        fout.write("cmsrel CMSSW_13_3_3\n")
-        fout.write("cd CMSSW_13_3_3/src\n")
-        fout.write("cmsenv\n")
-        fout.write("cd -\n")
-        fout.write(f"python3 /eos/home-z/zdemirag/forWH/doTriggerEff.py {tag} {isdata} {eta} output_{x}.root {' '.join(jobFiles)}\n")
-        fout.write(f"echo 'cp output_{x}.root /afs/cern.ch/user/b/bmay/output_{x}.root'\n")
-        fout.write(f"cp output_{x}.root /afs/cern.ch/user/b/bmay/output_{x}.root\n")
-        fout.write("echo 'STOP---------------'\n")
-        fout.write("echo\n")
-        fout.write("echo\n")
-    os.system(f"chmod 755 exec{tag}/job_{x}.sh")
+envSetup = "".join(line + "\n" for line in setupLines(envMode, cmsswRelease, sharedArea, envTarball, envCacheDir))
+
+# The logs of condor jobs stay in the schedd spool (condor_submit -spool) until fetched
+if backend == "condor":
+    fetched = fetchSpooledLogs(f"exec{tag}/clusters.txt")
+    if fetched:
+        print(f"Fetched the batch logs of clusters {' '.join(fetched)}")
+# Keep the telemetry of the previous jobs before their logs are cleared
+print(f"{harvestTelemetry(f'batchlogs{tag}', telemetryHistory)} new job telemetry records in {telemetryHistory}")
+
+if resubmit:
+    # Failed jobs of the original manifest, rerun with their original number, output name and inputs
+    failed = []
+    for x, outputName, jobFiles in readManifest(f"exec{tag}/manifest.txt"):
+        problems = checkOutput(os.path.join(outputDir, outputName), eta) + checkLogs(f"batchlogs{tag}", x)
+        if problems:
+            print(f"job {x} ({outputName}): {'; '.join(problems)}")
+            failed.append((x, outputName, jobFiles))
+    print(f"{len(failed)} jobs to resubmit")
+    nResubmit = len(glob.glob(f"exec{tag}/resubmit_*.txt")) + 1
+    manifest = f"exec{tag}/resubmit_{nResubmit}.txt"
+    with open(manifest, 'w') as fout:
+        for x, outputName, jobFiles in failed:
+            fout.write(f"{x} {outputName} {' '.join(jobFiles)}\n")
+    doSubmit = doSubmit and len(failed) > 0
+else:
+    # Work units (whole files, or cluster-aligned entry ranges of the large ones)
+    # balanced over the fewest jobs that fit the target wall time
+    maxCost = targetCost(queue, balanceBy, eventsPerSecond, bytesPerSecond, wallTimeFraction)
+    jobEngine = optionsEngineKey(jobOptions.split())
+    # The rdf engine reads whole files only (see rdfEff.py)
+    splitFiles = jobEngine != "rdf"
+    units = []
+    for fil in files:
+        units += fileUnits(fil, maxCost, balanceBy, splitFiles)
+
+    # Jobs of the previous submission whose output still matches its inputs and the
+    # selection configuration (see provenance.py) are kept instead of rerun
+    previous = readManifest(f"exec{tag}/manifest.txt") if os.path.isfile(f"exec{tag}/manifest.txt") else []
+    kept = []
+    if previous:
+        currentHash = subprocess.check_output([sys.executable, f"{scriptDir}/doTriggerEff.py", "--config-hash",
+                                               tag, isdata, eta, "none"], text=True).split()[-1]
+        specs = {unit["spec"] for unit in units}
+        for x, outputName, jobFiles in previous:
+            record = readProvenance(os.path.join(outputDir, outputName))
+            if all(spec in specs for spec in jobFiles) and matchesProvenance(record, jobFiles, currentHash):
+                kept.append((x, outputName, jobFiles))
+        keptSpecs = {spec for x, outputName, jobFiles in kept for spec in jobFiles}
+        units = [unit for unit in units if unit["spec"] not in keptSpecs]
+        print(f"{len(kept)} jobs of the previous submission are up to date and kept")
+    plannedJobs = planJobs(units, maxCost, balanceBy)
+
+    # Run time and memory predicted from past jobs; jobs over the wall time are split finer and re-packed
+    model = CostModel(readHistory(telemetryHistory))
+    if model.nJobs > 0:
+        predictUnits(model, units, jobEngine, tag, eventsPerSecond)
+        maxSeconds = QUEUE_WALL_TIME[queue] * wallTimeFraction
+        fitJobs = [job for job in plannedJobs if sum(u["seconds"] for u in job) <= QUEUE_WALL_TIME[queue]]
+        overJobs = [job for job in plannedJobs if sum(u["seconds"] for u in job) > QUEUE_WALL_TIME[queue]]
+        if overJobs:
+            print(f"{len(overJobs)} jobs predicted over the {queue} wall time, re-packing them")
+            repacked = []
+            for unit in (unit for job in overJobs for unit in job):
+                repacked += splitUnit(unit, maxSeconds * unit["entries"] / unit["seconds"]) if splitFiles else [unit]
+            predictUnits(model, repacked, jobEngine, tag, eventsPerSecond)
+            plannedJobs = fitJobs + planJobs(repacked, maxSeconds, "seconds")
+            units = [unit for job in plannedJobs for unit in job]
+    print(f"{len(files)} files, {len(units)} file/entry ranges")
+    printPlan(plannedJobs, queue, balanceBy, eventsPerSecond, bytesPerSecond)
+    jobs = [[unit["spec"] for unit in job] for job in plannedJobs]
+    if dryRun:
+        print()
+        print('END')
+        sys.exit(0)
+
+    path = os.getcwd()
+    print()
+    for folder in [f"tmp{tag}", f"exec{tag}", f"batchlogs{tag}"]:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    if NumberOfJobs == -1:
+        NumberOfJobs = len(jobs)
+    # New jobs take the numbers the kept ones don't use
+    keptNumbers = {x for x, outputName, jobFiles in kept}
+    numbers = (x for x in itertools.count(1) if x not in keptNumbers)
+    newJobs = [(x, f"output_{x}.root", jobFiles) for x, jobFiles in zip(numbers, jobs[:int(NumberOfJobs)])]
+    # Outputs of previous jobs that are neither kept nor rewritten would be merged with the new ones
+    newOutputs = {outputName for x, outputName, jobFiles in newJobs + kept}
+    for x, outputName, jobFiles in previous:
+        if outputName not in newOutputs and os.path.isfile(os.path.join(outputDir, outputName)):
+            os.rename(os.path.join(outputDir, outputName), os.path.join(outputDir, outputName + ".stale"))
+    ##### manifest: one line per job with its number, output name and input files or entry ranges #####
+    with open(f"exec{tag}/manifest.txt", 'w') as fout:
+        for x, outputName, jobFiles in sorted(kept + newJobs):
+            fout.write(f"{x} {outputName} {' '.join(jobFiles)}\n")
+    # Only the new jobs are submitted
+    manifest = f"exec{tag}/pending.txt"
+    with open(manifest, 'w') as fout:
+        for x, outputName, jobFiles in newJobs:
+            fout.write(f"{x} {outputName} {' '.join(jobFiles)}\n")
+    doSubmit = doSubmit and len(newJobs) > 0
+
+##### one executable for all jobs: output name and input files come as arguments #####
+with open(f'exec{tag}/run.sh', 'w') as fout:
+    fout.write("#!/bin/sh\n")
+    fout.write("output=$1\n")
+    fout.write("shift\n")
+    fout.write("echo\n")
+    fout.write("echo\n")
+    fout.write("echo 'START---------------'\n")
+    fout.write("echo 'WORKDIR ' ${PWD}\n")
+    fout.write("export HOME=$PWD\n")
+    fout.write(envSetup)
+    fout.write(f'python3 {scriptDir}/doTriggerEff.py {jobOptions} {tag} {isdata} {eta} $output "$@" || exit $?\n')
+    fout.write(f"echo \"cp $output {outputDir}/$output\"\n")
+    fout.write(f"cp $output {outputDir}/$output\n")
+    fout.write("echo 'STOP---------------'\n")
+    fout.write("echo\n")
+    fout.write("echo\n")
+os.chmod(f"exec{tag}/run.sh", 0o755)
 
 ###### create submit.sub file ####
-os.mkdir(f"batchlogs{tag}")
 with open('submit.sub', 'w') as fout:
-    fout.write("executable              = $(filename)\n")
-    fout.write("arguments               = $(Proxy_path) $(ClusterId)$(ProcId)\n")
-    fout.write(f"output                  = batchlogs{tag}/$(ClusterId).$(ProcId).out\n")
-    fout.write(f"error                   = batchlogs{tag}/$(ClusterId).$(ProcId).err\n")
+    fout.write(f"executable              = exec{tag}/run.sh\n")
+    fout.write("arguments               = $(output) $(inputs)\n")
+    fout.write(f"output                  = batchlogs{tag}/job_$(jobId).$(ClusterId).$(ProcId).out\n")
+    fout.write(f"error                   = batchlogs{tag}/job_$(jobId).$(ClusterId).$(ProcId).err\n")
     fout.write(f"log                     = batchlogs{tag}/$(ClusterId).log\n")
     fout.write(f'+JobFlavour = "{queue}"\n')
     fout.write("\n")
-    fout.write(f"queue filename matching (exec{tag}/job_*sh)\n")
+    fout.write(f"queue jobId, output, inputs from {manifest}\n")
 
 ###### sends bjobs ######
-os.system("echo submit.sub")
-if doSubmit:
-    os.system("condor_submit -spool submit.sub")
+if backend == "local":
+    if doSubmit:
+        failedJobs = runLocal(manifest, f"exec{tag}/run.sh", f"tmp{tag}", f"batchlogs{tag}", localWorkers)
+        print(f"{len(failedJobs)} jobs failed{': ' + ' '.join(map(str, failedJobs)) if failedJobs else ''}")
+else:
+    os.system("echo submit.sub")
+    if doSubmit:
+        # Fail here rather than in every job when the environment is missing
+        checkEnvironment(envMode, sharedArea, envTarball)
+        submitted = subprocess.run(["condor_submit", "-spool", "submit.sub"], capture_output=True, text=True)
+        print(submitted.stdout + submitted.stderr, end="")
+        # Recorded to fetch the spooled logs of the cluster on the next run
+        recordCluster(f"exec{tag}/clusters.txt", submitted.stdout)
 
-print()
-print("your jobs:")
-os.system("condor_q")
+    print()
+    print("your jobs:")
+    os.system("condor_q")
 print()
 print('END')
@@ -0,0 +1,38 @@
+import hashlib
+import json
+import os
+
+from trigEffUtils import parseInputFile
+
+# Provenance records of the doTriggerEff.py outputs.
+# Every output file stores, as a "provenance" TObjString, its input files (or
+# entry ranges) with the size and mtime of each file, and a hash of the
+# selection configuration. p3submitJobs.py keeps outputs whose record still
+# matches the inputs and configuration instead of reprocessing their chunks.
+
+
+def configHash(config):
+    """Hash of a JSON-serializable selection configuration (hlt, offlineCuts, histBins, ...)."""
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=list).encode()).hexdigest()
+
+
+def fileStamp(spec):
+    """(size, mtime) of the file of an input spec, None when it can't be stat'ed (e.g. a root:// URL)."""
+    try:
+        stat = os.stat(parseInputFile(spec)[0])
+    except OSError:
+        return None
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def provenanceRecord(inputFiles, config):
+    return {"config": configHash(config), "inputs": [[spec, fileStamp(spec)] for spec in inputFiles]}
+
+
+def matchesProvenance(record, inputFiles, currentHash):
+    """True when record was made from exactly these inputs, unchanged since, with the same configuration."""
+    if record is None or record["config"] != currentHash:
+        return False
+    if [spec for spec, stamp in record["inputs"]] != list(inputFiles):
+        return False
+    return all(stamp is not None and stamp == fileStamp(spec) for spec, stamp in record["inputs"])
@@ -3,7 +3,22 @@ import os, sys
 import argparse
 import numpy as np
 from array import array
-import json
+from lumiMask import load_lumi_mask
+from refCuts import REF_MET_CUT
+from trigEffUtils import popOption, selectionBranches, pruneBranches, emptyCounts, addCountsToHistos
+from trigEffUtils import parseInputFile, entryRange, iterEntries, iterEntryList
+from entryLists import ENTRY_LIST_MODES, persistEntryList, refEntries
+
+# Event loop engine: pyroot (default) or columnar (uproot/awkward, reading the
+# jagged branches only where the cheap cuts leave events, see columnarEff.py)
+engine = popOption(sys.argv, "--engine", "pyroot")
+if engine not in ["pyroot", "columnar"]:
+    raise ValueError(f"Unknown engine {engine}, use pyroot or columnar")
+# Persisted entry lists of the reference-passing events (see entryLists.py), opt-in:
+# off (default), auto (persisted for whole files only) or on (for entry ranges too)
+entryLists = popOption(sys.argv, "--entry-lists", "off")
+if entryLists not in ENTRY_LIST_MODES:
+    raise ValueError(f"Unknown entry-lists {entryLists}, use off, auto or on")
 
 # Define lepton type
 lepton = sys.argv[1] # Electron or Muon
@@ -76,26 +91,6 @@ else:  # Electron-specific configurations
     eta_bins = ["eta1", "eta2", "eta3"]
     eta_ranges = [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0)]
 
-# Load lumi masks and apply them
-def load_lumi_mask(file_path):
-    with open(file_path, 'r') as f:
-        goldenJSONDict = json.load(f)
-
-    def mask(run, luminosityBlock):
-        mask_array = np.zeros_like(run, dtype=bool)
-        for i in range(len(run)):
-            run_str = str(run[i])
-            if run_str in goldenJSONDict:
-                goodIntervals = goldenJSONDict[run_str]
-                for interval in goodIntervals:
-                    min_lumi, max_lumi = interval
-                    if min_lumi <= luminosityBlock[i] <= max_lumi:
-                        mask_array[i] = True
-                        break
-        return mask_array
-
-    return mask
-
 # Define reference cut function
 def passRefCut(ev, era, lumi_mask):
     if not lumi_mask([ev.run], [ev.luminosityBlock])[0]:
@@ -227,23 +222,64 @@ print("Starting %s" % inputFiles)
 inF = 0
 nF = len(inputFiles)
 
+selection = {
+    "lepton": lepton, "data": data, "era": era, "etaOption": etaOption,
+    "hlt": hlt, "refhlt": refhlt, "offlineCuts": offlineCuts,
+    "histBins": histBins, "eta_bins": eta_bins, "eta_ranges": eta_ranges,
+    "refMetCut": REF_MET_CUT,
+    "dRVeto": True, "metJetVetoAlways": True, "refInNum": False, "refInDen": False,
+    "hltRequired": True, "metRequired": True, "mtRequired": True,
+}
+
+if engine == "columnar":
+    import columnarEff
+    counts = emptyCounts(histBins, etaOption, eta_bins)
+else:
+    # Only the branches used by the selection are read
+    loopBranches = selectionBranches(lepton, hlt, refhlt, era if data == "data" else None)
+
 for iFile in inputFiles:
     inF += 1
     print(f"Starting file {inF}/{nF}, {iFile}")
-    tf = ROOT.TFile(iFile, "READ")
+    path, entryStart, entryStop = parseInputFile(iFile)
+
+    if engine == "columnar":
+        if data == "data" and entryLists != "off":
+            passing = refEntries(path, era, lumi_mask_func, REF_MET_CUT, entryStart, entryStop,
+                                 useCache=persistEntryList(entryLists, entryStart, entryStop))
+        else:
+            passing = None
+        stats = columnarEff.processFile(path, selection, lumi_mask_func if data == "data" else None, counts,
+                                        entryStart=entryStart, entryStop=entryStop, refEntries=passing)
+        # Like the pyroot loop, report the counts of the last file
+        muon_below27 = stats["below"] if lepton == "Muon" else 0
+        electron_below32 = stats["below"] if lepton == "Electron" else 0
+        continue
+
+    tf = ROOT.TFile(path, "READ")
     events = tf.Get("Events")
+    pruneBranches(events, loopBranches)
 
     iEv = 0
-    nEv = events.GetEntries()
+    # Whole file or entry range as given, before the range is resolved
+    persist = persistEntryList(entryLists, entryStart, entryStop)
+    entryStart, entryStop = entryRange(events.GetEntries(), entryStart, entryStop)
+    nEv = entryStop - entryStart
 
     muon_below27 = 0
     electron_below32 = 0
 
-    for ev in events:
+    # With entry lists only the events passing the reference cuts are read
+    if data == "data" and entryLists != "off":
+        entries = iterEntryList(events, refEntries(path, era, lumi_mask_func, REF_MET_CUT, entryStart, entryStop,
+                                                   useCache=persist))
+    else:
+        entries = iterEntries(events, entryStart, entryStop)
+    for ev in entries:
         iEv += 1
         if iEv % 1000 == 0:
             print(f"{iEv}/{nEv} events in file processed")
-        if(iEv % 100000 == 0): break
+#        if(iEv % 100000 == 0): break
 
         # Apply reference cuts for data early
         if data == "data" and not passRefCut(ev, era, lumi_mask_func):
@@ -316,7 +352,7 @@ for iFile in inputFiles:
         # Variables you want to study
 
         passmetCut = ev.MET_pt >= offlineCuts["MET"]
-        passlepCut = getattr(ev, lepton + "_pt")[leptonIndex] >= offlineCuts["lep1pt"]
+        passlepCut = highest_pt >= offlineCuts["lep1pt"]
         dphi = ((getattr(ev, lepton + "_phi")[leptonIndex]) - ev.MET_phi)
 #        mT = (2 * (getattr(ev, lepton + "_pt")[leptonIndex])  * (ev.MET_pt) * (1 - np.cos(dphi))) ** 0.5
 #        passmtCut = 30 < mT  < 130
@@ -386,6 +422,9 @@ for iFile in inputFiles:
 
     tf.Close()
 
+if engine == "columnar":
+    addCountsToHistos(histos, counts)
+
 for var in histBins:
     if etaOption == "Eta":
         for eta_bin in eta_bins:
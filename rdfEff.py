@@ -0,0 +1,118 @@
+import os
+from array import array
+import ROOT
+
+from trigEffUtils import parseInputFile
+
+# RDataFrame backend for doTriggerEff.py.
+# The selection is declared as Defines/Filters using the C++ helpers in
+# trigEffHelpers.h and every num/den histogram is booked lazily, so all of
+# them are filled in a single (implicitly multithreaded) event loop.
+
+HELPERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trigEffHelpers.h")
+
+LEADING_LEPTON = {
+    "Muon": "trigeff::leadingMuon(Muon_pt, Muon_eta, Muon_dz, Muon_dxy, Muon_tightId, Muon_pfIsoId)",
+    "Electron": "trigeff::leadingElectron(Electron_pt, Electron_eta, Electron_dz, Electron_dxy, "
+                "Electron_cutBased, Electron_mvaFall17V2Iso_WP80)",
+}
+
+DEN_CUTS = {
+    "lep1pt": "passmetCut && passmtCut",
+    "MET": "passlepCut && passmtCut",
+    "mT": "passlepCut && passmetCut",
+    "lep1phi": "passmetCut && passmtCut && passlepCut",
+    "MET phi": "passmetCut && passmtCut && passlepCut",
+}
+
+FILL_COLUMNS = {"lep1pt": "lepPt", "MET": "MET_pt", "mT": "mT", "lep1phi": "lepPhi", "MET phi": "MET_phi"}
+
+_declared = False
+
+
+def declareHelpers():
+    global _declared
+    if not _declared:
+        ROOT.gInterpreter.Declare(f'#include "{HELPERS}"')
+        _declared = True
+
+
+def etaBinExpr(eta_ranges):
+    """C++ expression for the get_eta_bin index of the leading lepton (-1 outside all ranges)."""
+    expr = "-1"
+    for i, (low, high) in reversed(list(enumerate(eta_ranges))):
+        expr = f"(std::abs(lepEta) >= {low} && std::abs(lepEta) < {high}) ? {i} : ({expr})"
+    return expr
+
+
+def histModel(name, var, binning):
+    if var == "lep1pt":
+        return ROOT.RDF.TH1DModel(name, name, len(binning) - 1, array('d', binning))
+    return ROOT.RDF.TH1DModel(name, name, binning[0], binning[1], binning[2])
+
+
+def bookHistos(inputFiles, cfg, nThreads=0):
+    """Build the doTriggerEff.py selection on an RDataFrame over inputFiles.
+
+    Returns the lazily booked num/den histograms keyed by the script's
+    histogram names, and the counts of leading leptons below the single-lepton
+    trigger thresholds. nThreads = 0 lets ROOT use every available core.
+    """
+    declareHelpers()
+    if nThreads != 1:
+        ROOT.EnableImplicitMT(nThreads)
+
+    lepton = cfg["lepton"]
+    offlineCuts = cfg["offlineCuts"]
+    histBins = cfg["histBins"]
+
+    files = ROOT.std.vector["std::string"]()
+    for iFile in inputFiles:
+        path, entryStart, entryStop = parseInputFile(iFile)
+        if entryStop is not None:
+            raise ValueError(f"The rdf engine reads whole files, use the pyroot engine for the entry range {iFile}")
+        files.push_back(path)
+    df = ROOT.RDataFrame("Events", files)
+    columns = set(str(c) for c in df.GetColumnNames())
+
+    # HLT paths missing from the input count as not fired
+    hltExpr = " || ".join(path for path in cfg["hlt"] if path in columns) or "false"
+
+    sel = (df.Define("lepIdx", LEADING_LEPTON[lepton])
+             .Filter("lepIdx >= 0", "leading lepton")
+             .Define("jetIdx", "trigeff::leadingJet(Jet_pt)")
+             .Filter("jetIdx >= 0", "leading jet")
+             .Define("lepPt", f"double({lepton}_pt[lepIdx])")
+             .Define("lepEta", f"double({lepton}_eta[lepIdx])")
+             .Define("lepPhi", f"double({lepton}_phi[lepIdx])")
+             .Define("jetPhi", "double(Jet_phi[jetIdx])")
+             .Filter("!(trigeff::dPhi(lepPhi, jetPhi) < 1.5)", "dPhi(lepton, jet)")
+             .Define("passmetCut", f"MET_pt >= {offlineCuts['MET']}")
+             .Filter("!(passmetCut && trigeff::dPhi(MET_phi, jetPhi) < 1.5)", "dPhi(MET, jet)")
+             .Define("lepton_matched", "trigeff::leadingLeptonMatched(lepEta, lepPhi, TrigObj_eta, TrigObj_phi, "
+                                       f"TrigObj_id, TrigObj_filterBits, {'true' if lepton == 'Electron' else 'false'})")
+             .Define("passHLT", hltExpr)
+             .Define("passlepCut", f"lepPt >= {offlineCuts['lep1pt']}")
+             .Define("mT", "std::sqrt(2 * lepPt * MET_pt * (1 - std::cos(lepPhi - MET_phi)))")
+             .Define("passmtCut", f"{offlineCuts['mT'][0]} < mT && mT < {offlineCuts['mT'][1]}")
+             .Define("passNum", "passHLT && lepton_matched"))
+
+    belowThreshold = {
+        "Muon": sel.Filter("lepPt < 27").Count() if lepton == "Muon" else None,
+        "Electron": sel.Filter("lepPt < 32").Count() if lepton == "Electron" else None,
+    }
+
+    if cfg["etaOption"] == "Eta":
+        sel = sel.Define("etaBin", etaBinExpr(cfg["eta_ranges"]))
+        prefixes = [(eta_bin + "_", f"etaBin == {i}") for i, eta_bin in enumerate(cfg["eta_bins"])]
+    else:
+        prefixes = [("", "true")]
+
+    results = {}
+    for prefix, binCut in prefixes:
+        for var in histBins:
+            den = sel.Filter(f"{binCut} && {DEN_CUTS[var]}")
+            for suffix, node in [("_den", den), ("_num", den.Filter("passNum"))]:
+                name = f"{prefix}{var}{suffix}"
+                results[name] = node.Histo1D(histModel(name, var, histBins[var]), FILL_COLUMNS[var])
+    return results, belowThreshold
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import json
+import sys
+import numpy as np
+
+from columnarEff import FILL_COLUMNS, fillSelected
+from eventSummary import readSummary
+from mergeOutputs import writeHistos
+from trigEffUtils import popOption, emptyCounts, histNames, nBins
+
+# Rebuild the num/den histograms of for_data.py from its per-event summaries
+# (see eventSummary.py), in seconds instead of a full reprocess.
+# Usage: python3 reHisto.py output.root summary.root [more summaries...]
+#            [--bins JSON] [--eta Eta|noEta] [--eta-ranges JSON] [--cuts JSON]
+#   --bins        binnings replacing or adding to the summary's histBins, e.g.
+#                 '{"lep1pt": [0, 20, 40, 100, 200], "MET": [60, 0, 300]}'
+#                 (lep1pt takes bin edges, the other variables [nbins, low, high])
+#   --eta         Eta for one histogram set per eta range, noEta for one set
+#   --eta-ranges  |eta| ranges of the eta sets, e.g. '[[0, 1.2], [1.2, 2.4]]'
+#   --cuts        offline cuts replacing the summary's, e.g. '{"lep1pt": 50, "mT": [40, 120]}'
+# The output has the histogram names and layout of the for_data.py outputs.
+
+
+def summaryHistos(counts, histBins, etaOption, eta_bins):
+    """Count arrays as writeHistos input: TH1F with the stats ROOT computes from the bin contents."""
+    histos = {}
+    for name, var in histNames(histBins, etaOption, eta_bins):
+        binning = histBins[var]
+        if var == "lep1pt":
+            edges = np.asarray(binning, dtype=np.float64)
+            axis = (len(edges) - 1, edges[0], edges[-1], edges)
+        else:
+            edges = np.linspace(binning[1], binning[2], binning[0] + 1)
+            axis = (binning[0], float(binning[1]), float(binning[2]), np.zeros(0))
+        values = counts[name]
+        inRange = values[1:-1]
+        centers = 0.5 * (edges[1:] + edges[:-1])
+        stats = [values.sum(), inRange.sum(), inRange.sum(), (inRange * centers).sum(), (inRange * centers ** 2).sum()]
+        histos[name] = {"cls": "TH1F", "title": name, "values": values, "sumw2": values.copy(),
+                        "stats": np.array(stats), "axis": axis}
+    return histos
+
+
+def applyOverrides(cfg, bins, etaOption, etaRanges, cuts):
+    """The selection configuration with the command line changes; raises ValueError for ones a summary can't give."""
+    cfg = dict(cfg)
+    if bins is not None:
+        unknown = [var for var in bins if var not in FILL_COLUMNS]
+        if unknown:
+            raise ValueError(f"No summary column for {unknown}, use {list(FILL_COLUMNS)}")
+        cfg["histBins"] = {**cfg["histBins"], **bins}
+    for var, binning in cfg["histBins"].items():
+        if nBins(var, binning) < 1:
+            raise ValueError(f"Binning {binning} of {var} has no bins")
+    if etaOption is not None:
+        if etaOption not in ["Eta", "noEta"]:
+            raise ValueError(f"Unknown eta option {etaOption}, use Eta or noEta")
+        cfg["etaOption"] = etaOption
+    if etaRanges is not None:
+        cfg["eta_ranges"] = etaRanges
+        cfg["eta_bins"] = [f"eta{i + 1}" for i in range(len(etaRanges))]
+    if cuts is not None:
+        # Rows were only written for events passing the cuts applied up front
+        preselected = {"MET": cfg.get("metRequired", False) or not cfg["metJetVetoAlways"],
+                       "mT": cfg.get("mtRequired", False)}
+        fixed = [cut for cut in cuts if preselected.get(cut, False) and cuts[cut] != cfg["offlineCuts"][cut]]
+        if fixed:
+            raise ValueError(f"The summary selection applied the {fixed} cuts up front, they can't be changed")
+        cfg["offlineCuts"] = {**cfg["offlineCuts"], **cuts}
+    return cfg
+
+
+if __name__ == "__main__":
+    bins = popOption(sys.argv, "--bins")
+    etaOption = popOption(sys.argv, "--eta")
+    etaRanges = popOption(sys.argv, "--eta-ranges")
+    cuts = popOption(sys.argv, "--cuts")
+    if len(sys.argv) < 3:
+        raise ValueError("Usage: python3 reHisto.py output.root summary.root [more summaries...] "
+                         "[--bins JSON] [--eta Eta|noEta] [--eta-ranges JSON] [--cuts JSON]")
+    outputFile = sys.argv[1]
+    summaryFiles = sys.argv[2:]
+
+    summaries = [readSummary(path) for path in summaryFiles]
+    cfg = summaries[0][1]
+    for path, (columns, other) in zip(summaryFiles, summaries):
+        if other != cfg:
+            raise ValueError(f"{path} was made with a different selection than {summaryFiles[0]}")
+    cfg = applyOverrides(cfg, json.loads(bins) if bins else None, etaOption,
+                         json.loads(etaRanges) if etaRanges else None, json.loads(cuts) if cuts else None)
+
+    counts = emptyCounts(cfg["histBins"], cfg["etaOption"], cfg["eta_bins"])
+    nRows = 0
+    for columns, _ in summaries:
+        fillSelected(columns, cfg, counts)
+        nRows += len(columns["lep1pt"])
+    writeHistos(outputFile, summaryHistos(counts, cfg["histBins"], cfg["etaOption"], cfg["eta_bins"]))
+    print(f"Filled {len(counts)} histograms from {nRows} events of {len(summaryFiles)} summaries into {outputFile}")
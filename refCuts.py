@@ -0,0 +1,47 @@
+import numpy as np
+import awkward as ak
+import uproot
+
+from trigEffUtils import metFilters, entryRange
+
+# Reference (orthogonal trigger) cuts for data, evaluated once per file or chunk:
+# golden-JSON lumi mask, MET_pt > 150 and the era-specific MET filters.
+
+REF_MET_CUT = 150
+STEP_SIZE = 500000
+
+
+def refBranches(era, metCut=REF_MET_CUT):
+    branches = ["run", "luminosityBlock"] + metFilters(era)
+    if metCut is not None:
+        branches.append("MET_pt")
+    return branches
+
+
+def metFilterMask(arrays, era):
+    mask = np.ones(len(arrays), dtype=bool)
+    for flag in metFilters(era):
+        mask &= ak.to_numpy(arrays[flag]).astype(bool)
+    return mask
+
+
+def refCutMask(arrays, era, lumi_mask, metCut=REF_MET_CUT):
+    """One boolean per event: lumi mask, MET_pt > metCut (skipped if None) and MET filters."""
+    mask = np.asarray(lumi_mask(ak.to_numpy(arrays["run"]), ak.to_numpy(arrays["luminosityBlock"])), dtype=bool)
+    if metCut is not None:
+        mask &= ak.to_numpy(arrays["MET_pt"]) > metCut
+    mask &= metFilterMask(arrays, era)
+    return mask
+
+
+def refCutMaskForFile(path, era, lumi_mask, metCut=REF_MET_CUT, stepSize=STEP_SIZE, entryStart=0, entryStop=None):
+    """Reference-cut mask for entries entryStart to entryStop of a file's Events tree, in entry order."""
+    with uproot.open(path) as f:
+        tree = f["Events"]
+        entryStart, entryStop = entryRange(tree.num_entries, entryStart, entryStop)
+        masks = [refCutMask(arrays, era, lumi_mask, metCut)
+                 for arrays in tree.iterate(refBranches(era, metCut), step_size=stepSize,
+                                            entry_start=entryStart, entry_stop=entryStop, library="ak")]
+    if not masks:
+        return np.zeros(0, dtype=bool)
+    return np.concatenate(masks)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import awkward as ak
+import numpy as np
+import uproot
+
+from lumiMask import load_lumi_mask
+from refCuts import STEP_SIZE, refBranches, refCutMask
+from trigEffUtils import popOption, parseInputFile, entryRange, selectionBranches, mapFiles
+
+# Skim stage for the data trigger-efficiency scripts.
+# Usage: python3 skim.py era outputDir input files... [--no-ref-trigger] [--workers N]
+# Every input file (or entry range) becomes outputDir/<name>_skim.root, an
+# Events tree holding only the branches the efficiency scripts read, for the
+# events passing the lumi mask, the MET filters and the reference trigger. The
+# branch names are the NanoAOD ones (jagged collections keep their nX counter),
+# so the skims are given to the scripts in place of the NanoAOD files.
+# for_data.py requires the reference trigger in every denominator and gives
+# the same histograms on either skim. quickerFor_data.py and
+# dataDoTriggerEff.py count events failing the reference trigger in their
+# denominators: skim their inputs with --no-ref-trigger.
+
+REF_TRIGGER = "HLT_MET120_IsoTrk50"
+# Every signal path of the efficiency scripts; paths missing in a file are skipped
+HLT_PATHS = ["HLT_IsoMu27", "HLT_Mu50", "HLT_Ele32_WPTight_Gsf", "HLT_Ele115_CaloIdVT_GsfTrkIdT",
+             "HLT_Photon175", "HLT_Photon200", REF_TRIGGER]
+LUMI_JSONS = {
+    "2016": "/eos/user/r/rresendi/Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON_scout.txt",
+    "2016APV": "/eos/user/r/rresendi/Cert_271036-284044_13TeV_Legacy2016APV_JSON_scout.txt",
+    "2017": "/eos/user/r/rresendi/Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt",
+    "2018": "/afs/cern.ch/user/b/bmay/Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt",
+}
+# Skims are read many times: favour fast decompression over size
+COMPRESSION = uproot.ZLIB(6)
+
+
+def skimBranches(era):
+    branches = refBranches(era)
+    for lepton in ["Muon", "Electron"]:
+        for branch in selectionBranches(lepton, HLT_PATHS):
+            if branch not in branches:
+                branches.append(branch)
+    return branches
+
+
+def skimName(spec):
+    path, entryStart, entryStop = parseInputFile(spec)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if entryStop is not None:
+        name += f"_{entryStart}_{entryStop}"
+    return name + "_skim.root"
+
+
+def toWritable(arrays, branches):
+    """Branch arrays as uproot writes them: scalars as numpy, each jagged collection zipped under its name."""
+    out = {}
+    collections = {}
+    for branch in branches:
+        if branch.startswith("n") and any(b.startswith(branch[1:] + "_") for b in branches):
+            continue  # counter, written by uproot with its collection
+        prefix = branch.split("_")[0]
+        if arrays[branch].ndim > 1:
+            collections.setdefault(prefix, {})[branch[len(prefix) + 1:]] = arrays[branch]
+        else:
+            out[branch] = ak.to_numpy(arrays[branch])
+    for prefix, fields in collections.items():
+        out[prefix] = ak.zip(fields)
+    return out
+
+
+def skimFile(spec, era, lumi_mask, outputDir, refTrigger=True, stepSize=STEP_SIZE):
+    """Write the skim of one input file; returns (skim path, events read, events kept)."""
+    path, entryStart, entryStop = parseInputFile(spec)
+    outPath = os.path.join(outputDir, skimName(spec))
+    nRead = nKept = 0
+    with uproot.open(path) as f, uproot.recreate(outPath, compression=COMPRESSION) as fout:
+        tree = f["Events"]
+        entryStart, entryStop = entryRange(tree.num_entries, entryStart, entryStop)
+        branches = [branch for branch in skimBranches(era) if branch in tree]
+        if refTrigger and REF_TRIGGER not in branches:
+            raise ValueError(f"{path} has no {REF_TRIGGER} branch")
+        # Made from the input branch types up front, so an empty input or entry
+        # range still gives an (empty) Events tree
+        empty = toWritable(tree.arrays(branches, entry_start=entryStart, entry_stop=entryStart, library="ak"), branches)
+        skimTree = fout.mktree("Events", {name: array.dtype if isinstance(array, np.ndarray) else array.type
+                                          for name, array in empty.items()})
+        for arrays in tree.iterate(branches, step_size=stepSize, entry_start=entryStart, entry_stop=entryStop, library="ak"):
+            mask = refCutMask(arrays, era, lumi_mask, metCut=None)
+            if refTrigger:
+                mask &= ak.to_numpy(arrays[REF_TRIGGER]).astype(bool)
+            skimTree.extend(toWritable(arrays[mask], branches))
+            nRead += len(mask)
+            nKept += int(np.count_nonzero(mask))
+        fout["skim"] = json.dumps({"source": spec, "era": era, "refTrigger": refTrigger, "read": nRead, "kept": nKept})
+    return outPath, nRead, nKept
+
+
+if __name__ == "__main__":
+    refTrigger = "--no-ref-trigger" not in sys.argv
+    if not refTrigger:
+        sys.argv.remove("--no-ref-trigger")
+    workers = int(popOption(sys.argv, "--workers", "1"))
+    era = sys.argv[1]
+    outputDir = sys.argv[2]
+    inputFiles = sys.argv[3:]
+    if era not in LUMI_JSONS:
+        raise ValueError("No era is defined. Please specify the year")
+    lumi_mask = load_lumi_mask(LUMI_JSONS[era])
+    os.makedirs(outputDir, exist_ok=True)
+
+    def skimInput(spec):
+        return skimFile(spec, era, lumi_mask, outputDir, refTrigger)
+
+    results = mapFiles(skimInput, inputFiles, workers) if workers > 1 else map(skimInput, inputFiles)
+    for outPath, nRead, nKept in results:
+        print(f"{outPath}: kept {nKept}/{nRead} events")
@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+ak = pytest.importorskip("awkward")
+uproot = pytest.importorskip("uproot")
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import skim
+from lumiMask import load_lumi_mask
+from refCuts import refCutMask
+
+# A skim must hold exactly the source events passing the reference cuts (and
+# the reference trigger unless --no-ref-trigger), with their branch values.
+# Every data consumer of the skims must also give the same histograms on a
+# skim as on the file it was made from: for_data.py reads skims with the
+# reference trigger applied, the other scripts skims made with
+# --no-ref-trigger. That comparison runs the scripts, so it needs ROOT and the
+# real golden JSON.
+CONSUMERS = [("for_data.py", True), ("quickerFor_data.py", False), ("dataDoTriggerEff.py", False)]
+ERA = "2018"
+N_EVENTS = 4000
+GOLDEN = {"315000": [[1, 80], [120, 150]], "315001": [[1, 199]], "315002": [[50, 100]]}
+
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
+needsScripts = pytest.mark.skipif(ROOT is None or not os.path.exists(skim.LUMI_JSONS[ERA]),
+                                  reason=f"needs ROOT and the {ERA} golden JSON at {skim.LUMI_JSONS[ERA]}")
+
+
+def jagged(counts, values):
+    return ak.unflatten(values(int(counts.sum())), counts)
+
+
+def writeNanoFile(path, lumiJson, seed=1):
+    """A small NanoAOD-like Events tree with the branches of the efficiency scripts."""
+    rng = np.random.default_rng(seed)
+    n = N_EVENTS
+    with open(lumiJson) as f:
+        golden = json.load(f)
+    runs = np.array([int(run) for run in golden][:3], dtype=np.uint32)
+    nMu, nEl, nJet, nObj = (rng.integers(0, 4, n), rng.integers(0, 4, n), rng.integers(0, 6, n), rng.integers(0, 8, n))
+
+    def floats(counts, low, high):
+        return jagged(counts, lambda t: rng.uniform(low, high, t).astype(np.float32))
+
+    def pts(counts, scale):
+        return jagged(counts, lambda t: rng.exponential(scale, t).astype(np.float32))
+
+    muon = ak.zip({
+        "pt": pts(nMu, 40), "eta": floats(nMu, -2.6, 2.6), "phi": floats(nMu, -np.pi, np.pi),
+        "dz": floats(nMu, -0.08, 0.08), "dxy": floats(nMu, -0.03, 0.03),
+        "tightId": jagged(nMu, lambda t: rng.random(t) < 0.8),
+        "pfIsoId": jagged(nMu, lambda t: rng.integers(0, 7, t).astype(np.uint8)),
+    })
+    electron = ak.zip({
+        "pt": pts(nEl, 40), "eta": floats(nEl, -2.7, 2.7), "phi": floats(nEl, -np.pi, np.pi),
+        "dz": floats(nEl, -0.2, 0.2), "dxy": floats(nEl, -0.1, 0.1),
+        "cutBased": jagged(nEl, lambda t: rng.integers(0, 5, t).astype(np.int32)),
+        "mvaFall17V2Iso_WP80": jagged(nEl, lambda t: rng.random(t) < 0.8),
+    })
+    jet = ak.zip({"pt": pts(nJet, 60), "eta": floats(nJet, -4.7, 4.7), "phi": floats(nJet, -np.pi, np.pi)})
+    # Trigger objects, the first one pointing at the leading muon or electron
+    pickMuon = rng.random(n) < 0.5
+    leadEta = np.where(pickMuon, ak.fill_none(ak.firsts(muon.eta), 0.0), ak.fill_none(ak.firsts(electron.eta), 0.0))
+    leadPhi = np.where(pickMuon, ak.fill_none(ak.firsts(muon.phi), 0.0), ak.fill_none(ak.firsts(electron.phi), 0.0))
+    objEta, objPhi = floats(nObj, -2.6, 2.6), floats(nObj, -np.pi, np.pi)
+    first = ak.local_index(objEta) == 0
+    objEta = ak.values_astype(ak.where(first, leadEta, objEta), np.float32)
+    objPhi = ak.values_astype(ak.where(first, leadPhi, objPhi), np.float32)
+    trigObj = ak.zip({
+        "id": jagged(nObj, lambda t: rng.choice([11, -11, 13, -13, 22], t).astype(np.int32)),
+        "eta": objEta, "phi": objPhi,
+        "filterBits": jagged(nObj, lambda t: rng.integers(0, 16384, t).astype(np.int32)),
+    })
+
+    branches = {
+        "Muon": muon, "Electron": electron, "Jet": jet, "TrigObj": trigObj,
+        # Some events in runs missing from the golden JSON
+        "run": np.where(rng.random(n) < 0.9, rng.choice(runs, n), 1).astype(np.uint32),
+        "luminosityBlock": rng.integers(1, 200, n).astype(np.uint32),
+        "MET_pt": rng.exponential(120, n).astype(np.float32),
+        "MET_phi": rng.uniform(-np.pi, np.pi, n).astype(np.float32),
+    }
+    for hltpath in skim.HLT_PATHS:
+        branches[hltpath] = rng.random(n) < 0.6
+    for branch in skim.skimBranches(ERA):
+        if branch.startswith("Flag_"):
+            branches[branch] = rng.random(n) < 0.97
+    with uproot.recreate(path) as f:
+        f.mktree("Events", {name: array.type if isinstance(array, ak.Array) else array.dtype
+                            for name, array in branches.items()},
+                 field_name=lambda outer, inner: f"{outer}_{inner}", counter_name=lambda counter: f"n{counter}")
+        f["Events"].extend(branches)
+
+
+def readCounts(path):
+    with uproot.open(path) as f:
+        return {name: f[name].values(flow=True) for name, cls in f.classnames(cycle=False).items()
+                if cls.startswith("TH1")}
+
+
+def runScript(script, lepton, output, inputs, env):
+    subprocess.run([sys.executable, os.path.join(REPO, script), lepton, "data", "Eta", ERA, output] + inputs,
+                   check=True, cwd=os.path.dirname(output), env=env, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="module")
+def goldenJson(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("golden") / "golden.json")
+    with open(path, "w") as f:
+        json.dump(GOLDEN, f)
+    return path
+
+
+@pytest.fixture(scope="module")
+def smallNanoFile(tmp_path_factory, goldenJson):
+    path = str(tmp_path_factory.mktemp("nano") / "nano.root")
+    writeNanoFile(path, goldenJson)
+    return path
+
+
+@pytest.mark.parametrize("entries", [None, (1000, 2500), (5, 5)])
+@pytest.mark.parametrize("refTrigger", [True, False])
+def test_skim_keeps_the_reference_selected_events(smallNanoFile, goldenJson, tmp_path, refTrigger, entries):
+    spec = smallNanoFile if entries is None else f"{smallNanoFile}[{entries[0]}:{entries[1]}]"
+    entryStart, entryStop = entries or (0, N_EVENTS)
+    lumi_mask = load_lumi_mask(goldenJson)
+    skimPath, nRead, nKept = skim.skimFile(spec, ERA, lumi_mask, str(tmp_path), refTrigger)
+
+    with uproot.open(smallNanoFile) as f:
+        tree = f["Events"]
+        branches = [branch for branch in skim.skimBranches(ERA) if branch in tree]
+        source = tree.arrays(branches, entry_start=entryStart, entry_stop=entryStop, library="ak")
+    mask = refCutMask(source, ERA, lumi_mask, metCut=None)
+    if refTrigger:
+        mask &= ak.to_numpy(source[skim.REF_TRIGGER])
+    expected = source[mask]
+    assert (nRead, nKept) == (entryStop - entryStart, len(expected))
+    if nRead > 0:
+        assert 0 < nKept < nRead
+
+    with uproot.open(skimPath) as f:
+        assert json.loads(str(f["skim"]))["kept"] == nKept
+        skimmed = f["Events"].arrays(branches, library="ak")
+    assert len(skimmed) == nKept
+    for branch in branches:
+        assert ak.to_list(skimmed[branch]) == ak.to_list(expected[branch]), branch
+
+
+@pytest.fixture(scope="module")
+def nanoFile(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("nano") / "nano.root")
+    writeNanoFile(path, skim.LUMI_JSONS[ERA])
+    return path
+
+
+@needsScripts
+@pytest.mark.parametrize("lepton", ["Muon", "Electron"])
+@pytest.mark.parametrize("script, refTrigger", CONSUMERS)
+def test_skim_gives_the_same_histograms(nanoFile, tmp_path, script, refTrigger, lepton):
+    env = dict(os.environ, TRIGEFF_ENTRYLIST_DIR=str(tmp_path / "entryLists"))
+    # dataDoTriggerEff.py reads the 2018 golden JSON from its working directory
+    shutil.copy(skim.LUMI_JSONS[ERA], tmp_path)
+    skimPath, nRead, nKept = skim.skimFile(nanoFile, ERA, load_lumi_mask(skim.LUMI_JSONS[ERA]), str(tmp_path), refTrigger)
+    assert 0 < nKept < nRead
+
+    runScript(script, lepton, str(tmp_path / "original.root"), [nanoFile], env)
+    runScript(script, lepton, str(tmp_path / "skimmed.root"), [skimPath], env)
+    original = readCounts(str(tmp_path / "original.root"))
+    skimmed = readCounts(str(tmp_path / "skimmed.root"))
+
+    assert original.keys() == skimmed.keys()
+    assert sum(counts.sum() for counts in original.values()) > 0
+    for name in original:
+        np.testing.assert_array_equal(original[name], skimmed[name], err_msg=name)
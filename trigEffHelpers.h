@@ -0,0 +1,118 @@
+#ifndef TRIGEFFHELPERS_H
+#define TRIGEFFHELPERS_H
+
+// C++ versions of the per-event helpers used by the trigger-efficiency scripts
+// (passes_lepton_cuts, passes_jet_cuts, dPhi, deltaR, is_leading_lepton_matched
+// and the leading-object scans). Arithmetic is done in double like the Python
+// versions, so the cut decisions are identical.
+
+#include <cmath>
+#include <cstdlib>
+
+#include "ROOT/RVec.hxx"
+
+namespace trigeff {
+
+using ROOT::RVec;
+
+inline double dPhi(double obj_phi, double jet_phi)
+{
+   return std::acos(std::cos(obj_phi - jet_phi));
+}
+
+inline double deltaR(double eta1, double phi1, double eta2, double phi2)
+{
+   const double deta = eta1 - eta2;
+   double dphi = phi1 - phi2;
+   dphi = std::atan2(std::sin(dphi), std::cos(dphi));
+   return std::sqrt(deta * deta + dphi * dphi);
+}
+
+template <typename F, typename B, typename I>
+bool passesMuonCuts(const RVec<F> &eta, const RVec<F> &dz, const RVec<F> &dxy, const RVec<B> &tightId,
+                    const RVec<I> &pfIsoId, std::size_t i)
+{
+   return tightId[i] && std::abs(double(eta[i])) < 2.4 && std::abs(double(dz[i])) <= 0.05 &&
+          std::abs(double(dxy[i])) <= 0.02 && int(pfIsoId[i]) >= 5;
+}
+
+template <typename F, typename I, typename B>
+bool passesElectronCuts(const RVec<F> &eta, const RVec<F> &dz, const RVec<F> &dxy, const RVec<I> &cutBased,
+                        const RVec<B> &mvaWP80, std::size_t i)
+{
+   const double absEta = std::abs(double(eta[i]));
+   return int(cutBased[i]) >= 2 && mvaWP80[i] && std::abs(double(dxy[i])) < 0.05 + 0.05 * (absEta > 1.479) &&
+          std::abs(double(dz[i])) < 0.10 + 0.10 * (absEta > 1.479) && (absEta < 1.444 || absEta > 1.566) &&
+          absEta < 2.5;
+}
+
+// Index of the highest-pT muon passing the cuts, -1 if there is none
+template <typename F, typename B, typename I>
+int leadingMuon(const RVec<F> &pt, const RVec<F> &eta, const RVec<F> &dz, const RVec<F> &dxy,
+                const RVec<B> &tightId, const RVec<I> &pfIsoId)
+{
+   double highest_pt = -1;
+   int index = -1;
+   for (std::size_t i = 0; i < pt.size(); ++i) {
+      if (passesMuonCuts(eta, dz, dxy, tightId, pfIsoId, i) && pt[i] > highest_pt) {
+         highest_pt = pt[i];
+         index = i;
+      }
+   }
+   return index;
+}
+
+// Index of the highest-pT electron passing the cuts, -1 if there is none
+template <typename F, typename I, typename B>
+int leadingElectron(const RVec<F> &pt, const RVec<F> &eta, const RVec<F> &dz, const RVec<F> &dxy,
+                    const RVec<I> &cutBased, const RVec<B> &mvaWP80)
+{
+   double highest_pt = -1;
+   int index = -1;
+   for (std::size_t i = 0; i < pt.size(); ++i) {
+      if (passesElectronCuts(eta, dz, dxy, cutBased, mvaWP80, i) && pt[i] > highest_pt) {
+         highest_pt = pt[i];
+         index = i;
+      }
+   }
+   return index;
+}
+
+// Index of the highest-pT jet above 60 GeV, -1 if there is none
+template <typename F>
+int leadingJet(const RVec<F> &pt)
+{
+   double highest_pt = -1;
+   int index = -1;
+   for (std::size_t i = 0; i < pt.size(); ++i) {
+      if (pt[i] > 60 && pt[i] > highest_pt) {
+         highest_pt = pt[i];
+         index = i;
+      }
+   }
+   return index;
+}
+
+// Electron: |id| 11 with filter bit 2, 2048 or 8192; muon: |id| 13 with bits 2 and 8, or bit 1024
+template <typename F, typename I, typename FB>
+bool leadingLeptonMatched(double lepton_eta, double lepton_phi, const RVec<F> &trigObj_eta,
+                          const RVec<F> &trigObj_phi, const RVec<I> &trigObj_id, const RVec<FB> &trigObj_filterBits,
+                          bool isElectron)
+{
+   for (std::size_t i = 0; i < trigObj_id.size(); ++i) {
+      const int id = std::abs(int(trigObj_id[i]));
+      const int bits = trigObj_filterBits[i];
+      bool passBits;
+      if (isElectron)
+         passBits = id == 11 && ((bits & 2) == 2 || (bits & 2048) == 2048 || (bits & 8192) == 8192);
+      else
+         passBits = id == 13 && (((bits & 2) == 2 && (bits & 8) == 8) || (bits & 1024) == 1024);
+      if (passBits && deltaR(lepton_eta, lepton_phi, trigObj_eta[i], trigObj_phi[i]) < 0.1)
+         return true;
+   }
+   return false;
+}
+
+} // namespace trigeff
+
+#endif
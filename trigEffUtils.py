@@ -0,0 +1,196 @@
+import multiprocessing
+import re
+import numpy as np
+
+# Helpers shared by the trigger-efficiency scripts (for_data.py, doTriggerEff.py, ...)
+
+# Branches read by the selection, besides MET and the HLT paths
+LEPTON_BRANCHES = {
+    "Muon": ["Muon_pt", "Muon_eta", "Muon_phi", "Muon_tightId", "Muon_dz", "Muon_dxy", "Muon_pfIsoId"],
+    "Electron": ["Electron_pt", "Electron_eta", "Electron_phi", "Electron_cutBased",
+                 "Electron_mvaFall17V2Iso_WP80", "Electron_dxy", "Electron_dz"],
+}
+JET_BRANCHES = ["Jet_pt", "Jet_eta", "Jet_phi"]
+TRIGOBJ_BRANCHES = ["TrigObj_eta", "TrigObj_phi", "TrigObj_id", "TrigObj_filterBits"]
+
+# MET filters of the data reference cuts
+FILTERS_2016 = [
+    "Flag_goodVertices",
+    "Flag_globalSuperTightHalo2016Filter",
+    "Flag_HBHENoiseFilter",
+    "Flag_HBHENoiseIsoFilter",
+    "Flag_EcalDeadCellTriggerPrimitiveFilter",
+    "Flag_BadPFMuonFilter",
+    "Flag_BadPFMuonDzFilter",
+    "Flag_eeBadScFilter",
+]
+FILTERS_2017 = FILTERS_2016 + ["Flag_ecalBadCalibFilter"]
+
+# TTreeCache size for the pruned PyROOT loops
+CACHE_SIZE = 30 * 1024 * 1024
+
+
+def metFilters(era):
+    if era in ["2018", "2017"]:
+        return FILTERS_2017
+    elif era in ["2016", "2016APV"]:
+        return FILTERS_2016
+    else:
+        raise ValueError("Unsupported era for quality filters")
+
+
+def selectionBranches(lepton, hlt, refhlt=None, refCutEra=None):
+    """Branches read by the PyROOT event loops.
+
+    refCutEra is the era when the reference cuts (lumi mask and MET filters)
+    are evaluated inside the loop, None otherwise.
+    """
+    branches = ["n" + lepton] + LEPTON_BRANCHES[lepton] + ["nJet"] + JET_BRANCHES + ["nTrigObj"] + TRIGOBJ_BRANCHES
+    branches += ["MET_pt", "MET_phi"]
+    if refCutEra is not None:
+        branches += ["run", "luminosityBlock"] + metFilters(refCutEra)
+    for hltpath in list(hlt) + ([refhlt] if refhlt else []):
+        if hltpath not in branches:
+            branches.append(hltpath)
+    return branches
+
+
+def pruneBranches(tree, branches, cacheSize=CACHE_SIZE):
+    """Disable every branch but the given ones and read those through a TTreeCache.
+
+    Branches missing from the tree (e.g. HLT paths of another era) are skipped;
+    the active ones are returned.
+    """
+    available = set(branch.GetName() for branch in tree.GetListOfBranches())
+    active = [branch for branch in branches if branch in available]
+    tree.SetBranchStatus("*", 0)
+    for branch in active:
+        tree.SetBranchStatus(branch, 1)
+    tree.SetCacheSize(cacheSize)
+    for branch in active:
+        tree.AddBranchToCache(branch, True)
+    tree.StopCacheLearningPhase()
+    return active
+
+
+def popOption(argv, flag, default=None):
+    """Remove an optional ``flag value`` pair from argv and return the value.
+
+    The scripts read their positional arguments straight from sys.argv, so
+    options are stripped out before any positional index is used.
+    """
+    if flag not in argv:
+        return default
+    idx = argv.index(flag)
+    value = argv[idx + 1]
+    del argv[idx:idx + 2]
+    return value
+
+
+def inputFileSpec(path, entryStart, entryStop):
+    """Input file argument selecting the entries entryStart <= i < entryStop of Events."""
+    return f"{path}[{entryStart}:{entryStop}]"
+
+
+def parseInputFile(spec):
+    """Split an input file argument into (path, entryStart, entryStop).
+
+    ``path[start:stop]`` (see inputFileSpec) selects an entry range, as written
+    by p3submitJobs.py for files split over several jobs; a plain path selects
+    every entry, with entryStop None.
+    """
+    match = re.match(r"^(.*)\[(\d+):(\d+)\]$", spec)
+    if match is None:
+        return spec, 0, None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+def entryRange(nEntries, entryStart=0, entryStop=None):
+    """(start, stop) clipped to the entries of the tree."""
+    if entryStop is None or entryStop > nEntries:
+        entryStop = nEntries
+    return min(entryStart, entryStop), entryStop
+
+
+def iterEntries(tree, entryStart=0, entryStop=None):
+    """Like ``for ev in tree``, over the entries entryStart <= i < entryStop only."""
+    entryStart, entryStop = entryRange(tree.GetEntries(), entryStart, entryStop)
+    for i in range(entryStart, entryStop):
+        tree.GetEntry(i)
+        yield tree
+
+
+def iterEntryList(tree, entries):
+    """Like iterEntries, over the given sorted entry numbers only."""
+    for i in entries:
+        tree.GetEntry(int(i))
+        yield tree
+
+
+def histNames(histBins, etaOption, eta_bins):
+    """Return (histogram name, variable) pairs in the order the scripts book them."""
+    names = []
+    if etaOption == "Eta":
+        for eta_bin in eta_bins:
+            for var in histBins:
+                names.append((f"{eta_bin}_{var}_num", var))
+                names.append((f"{eta_bin}_{var}_den", var))
+    else:
+        for var in histBins:
+            names.append((var + "_num", var))
+            names.append((var + "_den", var))
+    return names
+
+
+def nBins(var, binning):
+    if var == "lep1pt":
+        return len(binning) - 1
+    return binning[0]
+
+
+def emptyCounts(histBins, etaOption, eta_bins):
+    """Zeroed count arrays laid out like TH1 bins: underflow, bins..., overflow."""
+    return {name: np.zeros(nBins(var, histBins[var]) + 2) for name, var in histNames(histBins, etaOption, eta_bins)}
+
+
+def binIndices(var, binning, values):
+    """ROOT bin numbers (0 = underflow, nbins + 1 = overflow) for an array of values."""
+    values = np.asarray(values, dtype=np.float64)
+    if var == "lep1pt":
+        return np.searchsorted(np.asarray(binning, dtype=np.float64), values, side="right")
+    nbins, low, high = binning
+    inRange = (values >= low) & (values < high)
+    idx = np.where(values < low, 0, nbins + 1)
+    idx[inRange] = (nbins * (values[inRange] - low) / (high - low)).astype(np.int64) + 1
+    return idx
+
+
+def fillCounts(counts, name, var, binning, values):
+    counts[name] += np.bincount(binIndices(var, binning, values), minlength=len(counts[name]))
+
+
+def addCountsToHistos(histos, counts):
+    """Add count arrays onto the booked ROOT histograms, keeping GetEntries() right."""
+    for name, c in counts.items():
+        h = histos[name]
+        entries = h.GetEntries()
+        for i in np.nonzero(c)[0]:
+            h.SetBinContent(int(i), h.GetBinContent(int(i)) + c[i])
+        h.SetEntries(entries + c.sum())
+
+
+def histoCounts(histos):
+    """Bin contents of the histograms as count arrays (the inverse of addCountsToHistos)."""
+    return {name: np.array([h.GetBinContent(i) for i in range(h.GetNbinsX() + 2)]) for name, h in histos.items()}
+
+
+def mapFiles(worker, inputFiles, nWorkers):
+    """Yield worker(iFile) for every input file, computed by a pool of nWorkers processes.
+
+    The workers are forked, so they start from a copy of the calling script's
+    state (booked histograms, lumi mask, selection). Results come back in the
+    order of inputFiles.
+    """
+    with multiprocessing.get_context("fork").Pool(nWorkers, maxtasksperchild=1) as pool:
+        for result in pool.imap(worker, inputFiles):
+            yield result
@@ -0,0 +1,71 @@
+import numpy as np
+import awkward as ak
+
+# Trigger-object matching for whole chunks of events.
+# The filter bits are decoded once per chunk from FILTER_BITS, then every
+# offline lepton gets its closest passing TrigObj.
+
+# Per lepton type: TrigObj |id| and the accepted filterBits masks; a TrigObj
+# passes if all bits of at least one mask are set.
+FILTER_BITS = {
+    "Electron": (11, [2, 2048, 8192]),
+    "Muon": (13, [2 | 8, 1024]),
+}
+
+MATCH_DR = 0.1
+
+
+def deltaR(eta1, phi1, eta2, phi2):
+    deta = eta1 - eta2
+    dphi = phi1 - phi2
+    dphi = np.arctan2(np.sin(dphi), np.cos(dphi))
+    return np.sqrt(deta**2 + dphi**2)
+
+
+def trigObjPasses(trigObj_id, trigObj_filterBits, lepton_type):
+    """Jagged mask of TrigObjs with the right id and filter bits for lepton_type."""
+    pdgId, bitMasks = FILTER_BITS[lepton_type]
+    passBits = (trigObj_filterBits & bitMasks[0]) == bitMasks[0]
+    for bitMask in bitMasks[1:]:
+        passBits = passBits | ((trigObj_filterBits & bitMask) == bitMask)
+    return (abs(trigObj_id) == pdgId) & passBits
+
+
+def matchLeptons(lepton_eta, lepton_phi, trigObj_eta, trigObj_phi, trigObj_id, trigObj_filterBits,
+                 lepton_type, maxDR=MATCH_DR, trigMask=None):
+    """Match every lepton of every event to the passing trigger objects.
+
+    Lepton and TrigObj arguments are jagged (events x objects). trigMask is an
+    optional extra per-TrigObj selection. Returns, per lepton, the matched flag,
+    the min dR to a passing TrigObj (inf if there is none) and the index of the
+    matched TrigObj in the event's TrigObj collection (-1 if not matched).
+    """
+    passing = trigObjPasses(trigObj_id, trigObj_filterBits, lepton_type)
+    if trigMask is not None:
+        passing = passing & trigMask
+    trigObjs = ak.zip({"eta": trigObj_eta, "phi": trigObj_phi, "idx": ak.local_index(trigObj_eta)})[passing]
+    leptons = ak.zip({"eta": lepton_eta, "phi": lepton_phi})
+
+    lep, trig = ak.unzip(ak.cartesian([leptons, trigObjs], axis=1, nested=True))
+    dR = deltaR(lep.eta, lep.phi, trig.eta, trig.phi)
+    closest = ak.argmin(dR, axis=2, keepdims=True)
+    minDR = ak.fill_none(ak.firsts(dR[closest], axis=2), np.inf)
+    matched = minDR < maxDR
+    index = ak.where(matched, ak.fill_none(ak.firsts(trig.idx[closest], axis=2), -1), -1)
+    return matched, minDR, index
+
+
+def matchLeadingLepton(lepton_eta, lepton_phi, arrays, lepton_type, maxDR=MATCH_DR):
+    """matchLeptons for one lepton per event, as flat numpy arrays.
+
+    Replaces the per-event is_leading_lepton_matched loop; arrays holds the
+    TrigObj_* branches of the chunk.
+    """
+    # Explicit counts: a scalar count fails for an empty chunk
+    ones = np.ones(len(lepton_eta), dtype=np.int64)
+    matched, minDR, index = matchLeptons(ak.unflatten(np.asarray(lepton_eta), ones), ak.unflatten(np.asarray(lepton_phi), ones),
+                                         arrays["TrigObj_eta"], arrays["TrigObj_phi"],
+                                         arrays["TrigObj_id"], arrays["TrigObj_filterBits"],
+                                         lepton_type, maxDR)
+    return (ak.to_numpy(ak.flatten(matched)), ak.to_numpy(ak.flatten(minDR)),
+            ak.to_numpy(ak.flatten(index)))